@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import openai
+
+from ai_web_explorer import artifacts
+from ai_web_explorer import config
+from ai_web_explorer import loop
+from ai_web_explorer import metrics
+from ai_web_explorer import profiler
+from ai_web_explorer import promptlog
+
+import fixture_site
+import stub_openai
+
+parser = argparse.ArgumentParser(
+    description="Measure the throughput of the explore loop on a local fixture site "
+    "with a stub OpenAI API, no network access needed"
+)
+parser.add_argument(
+    "paths",
+    nargs="*",
+    help="HTML files or directories with HTML files the fixture site is built from",
+    default=fixture_site.parser.get_default("paths"),
+)
+parser.add_argument("--iterations", "-i", type=int, default=30)
+parser.add_argument("--workers", "-w", type=int, default=1)
+parser.add_argument(
+    "--latency",
+    "-l",
+    type=float,
+    help="Latency of the stub API in seconds",
+    default=0.0,
+)
+parser.add_argument(
+    "--links", type=int, help="Links from every fixture page to other pages", default=3
+)
+parser.add_argument("--seed", "-s", type=int, default=0)
+parser.add_argument(
+    "--min-rate",
+    "-m",
+    type=float,
+    help="Fail with exit code 1 when fewer iterations per minute are explored",
+    default=None,
+)
+parser.add_argument(
+    "--output", "-o", type=str, help="Write the results to a JSON file", default=None
+)
+parser.add_argument(
+    "--headed", action="store_true", help="Show the browser window while exploring"
+)
+
+
+def main():
+    args = parser.parse_args()
+    site = fixture_site.FixtureSite(
+        fixture_site.load_pages(args.paths), args.links, args.seed
+    )
+    site_server = fixture_site.FixtureSiteServer(site)
+    stub_server = stub_openai.StubOpenAIServer(stub_openai.StubResponder(args.latency))
+    site_server.start()
+    stub_server.start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Nothing the exploration stores should end up in the data directory
+        config.BROWSER_HEADLESS = not args.headed
+        config.LLM_CACHE_MODE = "disabled"
+        config.PROMPT_LOGS_PATH = os.path.join(tmp_dir, "prompt_logs.jsonl")
+        config.EMBEDDING_CACHE_PATH = os.path.join(tmp_dir, "embeddings_cache")
+        config.HTMLS_PATH = os.path.join(tmp_dir, "htmls")
+        config.SCREENSHOTS_PATH = os.path.join(tmp_dir, "screenshots")
+        config.ARTIFACTS_INDEX_PATH = os.path.join(tmp_dir, "pages.jsonl")
+        config.TITLES_PATH = os.path.join(tmp_dir, "titles.jsonl")
+
+        client = openai.Client(base_url=stub_server.base_url, api_key="stub")
+        profile = profiler.enable()
+        loop_config = loop.LoopConfig(iterations=args.iterations)
+        url = f"http://{site_server.domain}"
+
+        start = time.perf_counter()
+        if args.workers > 1:
+            explore_loop = loop.ParallelExploreLoop(
+                site_server.domain, url, client, loop_config, args.workers
+            )
+        else:
+            explore_loop = loop.ExploreLoop(
+                site_server.domain, url, client, loop_config
+            )
+        setup_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            explore_loop.start()
+        finally:
+            explore_loop.stop()
+        explore_time = time.perf_counter() - start
+
+        # Background writers finish writing before the temporary directory is removed
+        promptlog.get_writer().close()
+        artifacts.get_store().close()
+
+    site_server.shutdown()
+    stub_server.shutdown()
+
+    phases = profile.summary()
+    iterations = next((p["count"] for p in phases if p["name"] == "iteration"), 0)
+    states = len(explore_loop._graph.webstates)
+    prompts = metrics.get_registry().to_dict()["prompts"]
+    llm_calls = sum(p["calls"] for p in prompts.values())
+    rate = iterations / explore_time * 60 if explore_time else 0.0
+
+    print(f"Fixture pages: {len(site.pages)}, stub latency: {args.latency} s")
+    print(f"Setup:       {setup_time:10.2f} s")
+    print(f"Exploration: {explore_time:10.2f} s")
+    print(f"Iterations:  {iterations:10d}   {rate:8.1f} per minute")
+    print(f"States:      {states:10d}")
+    print(f"LLM calls:   {llm_calls:10d}   {llm_calls / max(states, 1):8.1f} per state")
+
+    for name, prompt_metrics in prompts.items():
+        print(
+            f"  {name:<24} {prompt_metrics['calls']:6d} calls   "
+            f"{prompt_metrics['calls'] / max(states, 1):6.2f} per state"
+        )
+
+    print()
+    print(profile.format_summary())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "pages": len(site.pages),
+                    "latency": args.latency,
+                    "workers": args.workers,
+                    "setup_time": setup_time,
+                    "explore_time": explore_time,
+                    "iterations": iterations,
+                    "iterations_per_minute": rate,
+                    "states": states,
+                    "llm_calls": llm_calls,
+                    "llm_calls_per_state": llm_calls / max(states, 1),
+                    "prompts": prompts,
+                    "phases": phases,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.min_rate is not None and rate < args.min_rate:
+        print(f"FAILED: {rate:.1f} iterations per minute, expected {args.min_rate}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
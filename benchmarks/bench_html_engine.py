@@ -0,0 +1,139 @@
+import argparse
+import difflib
+import glob
+import os
+import re
+import time
+
+import bs4
+import playwright.sync_api
+
+from ai_web_explorer import config
+from ai_web_explorer import html
+
+parser = argparse.ArgumentParser(
+    description="Compare the Python and browser HTML cleaning engines on stored pages"
+)
+parser.add_argument(
+    "paths",
+    nargs="*",
+    help="HTML files or directories with HTML files",
+    default=[
+        config.HTMLS_PATH,
+        os.path.join(config.BASE_PATH, "tests", "data", "actions", "htmls"),
+    ],
+)
+parser.add_argument("--repeat", "-n", type=int, default=3)
+
+# Number of lines of the difference printed for each mismatching page
+MAX_DIFF_LINES = 40
+
+
+def canonical(html_str: str) -> list[str]:
+    # Serializes the parsed HTML one tag or text per line with sorted attributes and
+    # whitespace runs collapsed to a single space, so only differences that reach the
+    # prompts are reported
+    soup = bs4.BeautifulSoup(html_str, "html.parser")
+    lines = []
+
+    def serialize(node: bs4.PageElement, keep_whitespace: bool):
+        if isinstance(node, bs4.Doctype):
+            return
+        if isinstance(node, bs4.NavigableString):
+            text = str(node) if keep_whitespace else re.sub(r"\s+", " ", str(node))
+            if text:
+                lines.append(repr(text))
+            return
+        if not isinstance(node, bs4.Tag):
+            return
+        attributes = "".join(
+            f" {name}={value!r}" for name, value in sorted(node.attrs.items())
+        )
+        lines.append(f"<{node.name}{attributes}>")
+        for child in node.children:
+            serialize(child, keep_whitespace or node.name in ("pre", "textarea"))
+        lines.append(f"</{node.name}>")
+
+    for child in soup.children:
+        serialize(child, False)
+    return lines
+
+
+def report_mismatch(file: str, python_lines: list[str], browser_lines: list[str]):
+    print(f"Output mismatch: {file}")
+    diff = list(
+        difflib.unified_diff(
+            python_lines, browser_lines, "python", "browser", lineterm="", n=1
+        )
+    )
+    for line in diff[:MAX_DIFF_LINES]:
+        print(f"    {line}")
+    if len(diff) > MAX_DIFF_LINES:
+        print(f"    ... {len(diff) - MAX_DIFF_LINES} more lines")
+
+
+def clean(page: playwright.sync_api.Page, engine: str) -> tuple[str, float]:
+    config.HTML_CLEANING_ENGINE = engine
+    start = time.perf_counter()
+    html_clean = html._clean_html(page, minified=True)
+    return html_clean, time.perf_counter() - start
+
+
+def main():
+    args = parser.parse_args()
+    files = []
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.html"))))
+        elif os.path.isfile(path):
+            files.append(path)
+
+    if not files:
+        print("No HTML files found")
+        return
+
+    totals = {"python": 0.0, "browser": 0.0}
+    sizes = {"python": 0, "browser": 0}
+    mismatches = 0
+
+    with playwright.sync_api.sync_playwright() as pw:
+        browser = pw.chromium.launch()
+        page = browser.new_page()
+        page.add_init_script(html.JS_FUNCTIONS)
+        page.set_viewport_size(
+            {"width": config.BROWSER_SIZE[0], "height": config.BROWSER_SIZE[1]}
+        )
+
+        for file in files:
+            page.goto(f"file://{os.path.abspath(file)}")
+            outputs = {}
+
+            for engine in totals:
+                for _ in range(args.repeat):
+                    outputs[engine], duration = clean(page, engine)
+                    totals[engine] += duration
+                sizes[engine] += len(outputs[engine])
+
+            python_lines = canonical(outputs["python"])
+            browser_lines = canonical(outputs["browser"])
+            if python_lines != browser_lines:
+                mismatches += 1
+                report_mismatch(file, python_lines, browser_lines)
+
+        browser.close()
+
+    runs = len(files) * args.repeat
+    print(f"Pages: {len(files)}, mismatches: {mismatches}")
+
+    for engine in totals:
+        print(
+            f"{engine:<8} {totals[engine] / runs * 1000:8.1f} ms/page   "
+            f"{sizes[engine] / len(files) / 1000:8.1f} kB/page"
+        )
+
+    print(f"Speedup: {totals['python'] / totals['browser']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
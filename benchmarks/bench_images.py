@@ -0,0 +1,69 @@
+import argparse
+import glob
+import os
+import time
+
+from ai_web_explorer import config
+from ai_web_explorer import images
+
+parser = argparse.ArgumentParser(
+    description="Compare sizes and encoding times of screenshots sent with prompts"
+)
+parser.add_argument(
+    "--screenshots",
+    "-s",
+    type=str,
+    help="Directory with <id>_before.png and <id>_after.png screenshots of actions",
+    default=os.path.join(config.BASE_PATH, "tests", "data", "actions", "screenshots"),
+)
+
+POLICIES = {
+    "original png": images.ImagePolicy(),
+    "768 png": images.ImagePolicy(max_size=768),
+    "jpeg 85": images.ImagePolicy(format="jpeg"),
+    "768 jpeg 80": images.ImagePolicy(max_size=768, format="jpeg", quality=80),
+    "512 jpeg 80": images.ImagePolicy(max_size=512, format="jpeg", quality=80),
+    "768 webp 80": images.ImagePolicy(max_size=768, format="webp", quality=80),
+    "crop jpeg 85": images.ImagePolicy(format="jpeg", crop_changes=True),
+}
+
+
+def main():
+    args = parser.parse_args()
+    pairs = []
+
+    for before_path in sorted(
+        glob.glob(os.path.join(args.screenshots, "*_before.png"))
+    ):
+        after_path = before_path.replace("_before.png", "_after.png")
+        with open(before_path, "rb") as f_before, open(after_path, "rb") as f_after:
+            pairs.append([f_before.read(), f_after.read()])
+
+    if not pairs:
+        print("No screenshots found")
+        return
+
+    print(f"Screenshot pairs: {len(pairs)}")
+
+    for name, policy in POLICIES.items():
+        encoder = images.ImageEncoder(cache_size=len(pairs) * 3)
+        start = time.perf_counter()
+        encoded = [encoder.encode(pair, policy) for pair in pairs]
+        cold = time.perf_counter() - start
+
+        # The same screenshots encoded again, e.g. for another part of a page
+        start = time.perf_counter()
+        for pair in pairs:
+            encoder.encode(pair, policy)
+        memoized = time.perf_counter() - start
+
+        size = sum(len(url) for urls in encoded for url in urls) / len(pairs) / 2
+        print(
+            f"{name:<14} {size / 1024:8.1f} kB/image   "
+            f"encode: {cold / len(pairs) / 2 * 1000:7.2f} ms   "
+            f"memoized: {memoized / len(pairs) / 2 * 1000:6.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
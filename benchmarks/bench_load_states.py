@@ -0,0 +1,158 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from ai_web_explorer import config
+from ai_web_explorer import webstate
+
+parser = argparse.ArgumentParser(description="Measure loading times of saved graphs")
+parser.add_argument(
+    "--states",
+    "-s",
+    type=str,
+    help="Comma separated numbers of states",
+    default="1000,10000,50000",
+)
+parser.add_argument(
+    "--template",
+    "-t",
+    type=str,
+    help="Saved graph used as a template for the states of the synthetic graphs",
+    default=os.path.join(config.DATA_PATH, "test_state.json"),
+)
+parser.add_argument(
+    "--baseline-max-states",
+    "-b",
+    type=int,
+    help="Largest graph loaded with the original loader, which is quadratic",
+    default=5000,
+)
+parser.add_argument(
+    "--without-embeddings",
+    "-e",
+    action="store_true",
+    help="Leave out title embeddings, which take most of the loading time",
+)
+parser.add_argument(
+    "--embeddings-file",
+    "-n",
+    action="store_true",
+    help="Store title embeddings in a .npy file next to the graph like --embeddings",
+)
+
+
+def load_states_from_file_baseline(file_path: str) -> list[webstate.WebState]:
+    # Loader before streaming and the ws_id index, output printed to /dev/null
+    with open(file_path, "r") as f, open(os.devnull, "w") as devnull:
+        json_string = f.read()
+        with contextlib.redirect_stdout(devnull):
+            print(json_string)
+        webstates_raw = json.loads(json_string)
+
+    webstates = []
+    transitions_raw = []
+
+    for ws_raw in webstates_raw:
+        webstates.append(webstate.WebState.from_dict(ws_raw))
+        transitions_raw.extend(
+            (uuid.UUID(ws_raw["ws_id"]), t) for t in ws_raw["transitions"] if t
+        )
+
+    for state_id, transition_raw in transitions_raw:
+        state_current = next(ws for ws in webstates if ws.ws_id == state_id)
+        action = webstate.Action.from_dict(transition_raw["action"])
+        state_new = next(
+            ws for ws in webstates if ws.ws_id == uuid.UUID(transition_raw["state_new"])
+        )
+        state_current.transitions.append(webstate.StateTransition(action, state_new))
+
+    return webstates
+
+
+def write_graph(
+    templates: list[dict], states_count: int, file_path: str, embeddings_file: bool
+) -> int:
+    # States are copies of the template states with new IDs, every transition of a
+    # template leads to a random state of the synthetic graph
+    rng = random.Random(0)
+    ws_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(states_count)]
+    embeddings = []
+
+    with open(file_path, "w") as f:
+        f.write("[\n")
+        for i, ws_id in enumerate(ws_ids):
+            ws_raw = dict(templates[i % len(templates)])
+            ws_raw["ws_id"] = ws_id
+            if embeddings_file and "title_embedding" in ws_raw:
+                embeddings.append(ws_raw.pop("title_embedding"))
+                ws_raw["title_embedding_row"] = len(embeddings) - 1
+            ws_raw["transitions"] = [
+                {**t, "state_new": rng.choice(ws_ids)}
+                for t in ws_raw["transitions"]
+                if t
+            ]
+            f.write(json.dumps(ws_raw))
+            f.write(",\n" if i < states_count - 1 else "\n")
+        f.write("]\n")
+
+    if not embeddings:
+        return os.path.getsize(file_path)
+
+    embeddings_path = os.path.splitext(file_path)[0] + ".npy"
+    np.save(embeddings_path, np.array(embeddings, dtype=np.float32))
+    return os.path.getsize(file_path) + os.path.getsize(embeddings_path)
+
+
+def measure(load, file_path: str) -> tuple[float, int]:
+    start = time.perf_counter()
+    webstates = load(file_path)
+    duration = time.perf_counter() - start
+    transitions_count = sum(len(ws.transitions) for ws in webstates)
+    return duration, transitions_count
+
+
+def main():
+    args = parser.parse_args()
+
+    with open(args.template) as f:
+        templates = json.load(f)
+
+    if args.without_embeddings:
+        for template in templates:
+            template.pop("title_embedding", None)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for states_count in [int(s) for s in args.states.split(",")]:
+            file_path = os.path.join(tmp_dir, f"graph_{states_count}.json")
+            size = write_graph(templates, states_count, file_path, args.embeddings_file)
+            size /= 1024 * 1024
+
+            print(f"----- {states_count} states, {size:.0f} MB -----")
+            indexed, transitions_count = measure(
+                webstate.load_states_from_file, file_path
+            )
+            print(f"transitions: {transitions_count}")
+
+            # The original loader does not support embeddings files
+            if states_count <= args.baseline_max_states and not args.embeddings_file:
+                baseline, _ = measure(load_states_from_file_baseline, file_path)
+                print(f"baseline {baseline:10.2f} s")
+                print(
+                    f"indexed  {indexed:10.2f} s   speedup: {baseline / indexed:8.1f}x"
+                )
+            else:
+                print(f"indexed  {indexed:10.2f} s")
+
+            for file in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import argparse
+import timeit
+
+from ai_web_explorer import config
+from ai_web_explorer import promptrepo
+
+PROMPT_NAMES = ["execute_action", "verify_action", "page_title", "is_loading"]
+
+parser = argparse.ArgumentParser(description="Measure per-call overhead of get_prompt")
+parser.add_argument("--calls", "-n", type=int, default=1000)
+
+
+def get_prompt_uncached(name: str) -> promptrepo.Prompt:
+    # Equivalent of get_prompt before the registry - parse the YAML on every call
+    return promptrepo._parse_prompt(name, promptrepo._load_prompts(config.PROMPTS_PATH))
+
+
+def main():
+    args = parser.parse_args()
+
+    for name in PROMPT_NAMES:
+        before = timeit.timeit(lambda: get_prompt_uncached(name), number=args.calls)
+        after = timeit.timeit(lambda: promptrepo.get_prompt(name), number=args.calls)
+        print(
+            f"{name:<16} before: {before / args.calls * 1e6:10.1f} us/call   "
+            f"after: {after / args.calls * 1e6:8.1f} us/call   "
+            f"speedup: {before / after:8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
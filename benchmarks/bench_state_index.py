@@ -0,0 +1,90 @@
+import argparse
+import importlib.util
+import time
+
+import numpy as np
+
+from ai_web_explorer import config
+from ai_web_explorer import webstate
+
+parser = argparse.ArgumentParser(description="Measure similar state lookup times")
+parser.add_argument(
+    "--states",
+    "-s",
+    type=str,
+    help="Comma separated numbers of states",
+    default="1000,10000,100000",
+)
+parser.add_argument("--dimensions", "-d", type=int, default=1536)
+parser.add_argument("--queries", "-q", type=int, default=20)
+
+
+def create_states(embeddings: np.ndarray) -> list[webstate.WebState]:
+    return [
+        webstate.WebState(
+            title=f"State {i}",
+            title_embedding=embedding,  # type: ignore
+            urls=[],
+            description=[],
+            actions=[],
+            transitions=[],
+        )
+        for i, embedding in enumerate(embeddings)
+    ]
+
+
+def find_similar_linear(states: list[webstate.WebState], embedding: np.ndarray):
+    # Lookup used by ExploreLoop._get_webstate before the index
+    for ws in states:
+        if ws.cosine_distance(embedding) > config.TITLE_SIMILARITY_THRESHOLD:  # type: ignore
+            return ws
+    return None
+
+
+def measure(find, queries: np.ndarray) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        find(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    backends = ["numpy"]
+
+    if importlib.util.find_spec("hnswlib"):
+        backends.append("hnswlib")
+
+    for states_count in [int(s) for s in args.states.split(",")]:
+        embeddings = rng.standard_normal((states_count, args.dimensions))
+        embeddings = embeddings.astype(np.float32)
+        states = create_states(embeddings)
+        # Half of the queries have a matching state, the other half does not
+        queries = np.concatenate(
+            [
+                embeddings[rng.integers(0, states_count, args.queries // 2)],
+                rng.standard_normal((args.queries // 2, args.dimensions)),
+            ]
+        )
+
+        print(f"----- {states_count} states -----")
+        linear = measure(lambda q: find_similar_linear(states, q), queries)
+        print(f"linear scan        query: {linear:10.3f} ms")
+
+        for backend in backends:
+            start = time.perf_counter()
+            index = webstate.StateIndex(states, backend=backend)
+            build = time.perf_counter() - start
+            indexed = measure(
+                lambda q: index.find_similar(q, config.TITLE_SIMILARITY_THRESHOLD),  # type: ignore
+                queries,
+            )
+            print(
+                f"{backend:<18} query: {indexed:10.3f} ms   build: {build:8.2f} s   "
+                f"speedup: {linear / indexed:8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
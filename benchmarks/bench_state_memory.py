@@ -0,0 +1,105 @@
+import argparse
+import dataclasses
+import gc
+import json
+import os
+import tracemalloc
+import uuid
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from ai_web_explorer import config
+from ai_web_explorer import webstate
+
+parser = argparse.ArgumentParser(description="Measure memory used by loaded states")
+parser.add_argument("--states", "-s", type=int, default=10000)
+parser.add_argument(
+    "--template",
+    "-t",
+    type=str,
+    help="Saved graph used as a template for the states",
+    default=os.path.join(config.DATA_PATH, "test_state.json"),
+)
+
+
+# Representation before slotted classes and float32 embeddings
+@dataclasses.dataclass
+class ActionBaseline:
+    description: str
+    part: int
+    priority: int
+    status: str = dataclasses.field(default="none")
+    function_calls: list = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class WebStateBaseline:
+    title: str
+    title_embedding: list[float]
+    urls: list[str]
+    description: list[dict]
+    actions: list[ActionBaseline]
+    transitions: list
+    ws_id: uuid.UUID = dataclasses.field(default_factory=uuid.uuid4)
+
+
+def create_baseline(ws_raw: dict) -> WebStateBaseline:
+    return WebStateBaseline(
+        title=ws_raw["title"],
+        title_embedding=ws_raw["title_embedding"],
+        urls=ws_raw["urls"],
+        description=ws_raw["description"],
+        actions=[
+            ActionBaseline(
+                description=a["description"],
+                part=a["part"],
+                priority=a["priority"],
+                status=a["status"],
+                function_calls=[
+                    ChatCompletionMessageToolCall(**f) for f in a["function_calls"]
+                ],
+            )
+            for a in ws_raw["actions"]
+        ],
+        transitions=[],
+        ws_id=uuid.UUID(ws_raw["ws_id"]),
+    )
+
+
+def measure(create, templates_json: list[str], states_count: int) -> float:
+    # States are decoded from JSON like when a graph is restored, only memory
+    # still used once the decoded JSON is released is counted
+    gc.collect()
+    tracemalloc.start()
+    states = []
+
+    for i in range(states_count):
+        ws_raw = json.loads(templates_json[i % len(templates_json)])
+        ws_raw["ws_id"] = str(uuid.uuid4())
+        states.append(create(ws_raw))
+
+    del ws_raw
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / states_count
+
+
+def main():
+    args = parser.parse_args()
+
+    with open(args.template) as f:
+        templates_json = [json.dumps(ws_raw) for ws_raw in json.load(f)]
+
+    baseline = measure(create_baseline, templates_json, args.states)
+    compact = measure(webstate.WebState.from_dict, templates_json, args.states)
+
+    print(f"States: {args.states}")
+    print(f"baseline {baseline / 1024:10.1f} kB/state")
+    print(
+        f"compact  {compact / 1024:10.1f} kB/state   ratio: {baseline / compact:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
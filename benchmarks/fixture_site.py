@@ -0,0 +1,146 @@
+import argparse
+import glob
+import gzip
+import http.server
+import os
+import random
+import threading
+
+from ai_web_explorer import config
+
+parser = argparse.ArgumentParser(
+    description="Serve stored pages as a local multi-page website"
+)
+parser.add_argument(
+    "paths",
+    nargs="*",
+    help="HTML files or directories with HTML files",
+    default=[
+        os.path.join(config.BASE_PATH, "tests", "data", "title", "htmls"),
+        os.path.join(config.BASE_PATH, "tests", "data", "actions", "htmls"),
+        config.HTMLS_PATH,
+    ],
+)
+parser.add_argument("--port", "-p", type=int, default=8000)
+parser.add_argument(
+    "--links", "-l", type=int, help="Links from every page to other pages", default=3
+)
+parser.add_argument("--seed", "-s", type=int, default=0)
+
+NAV_TEMPLATE = '<nav id="fixture-nav">{links}</nav>'
+LINK_TEMPLATE = (
+    '<a id="fixture-link-{link}" href="/p/{target}">Fixture page {target}</a>'
+)
+
+
+# Stored pages are static snapshots without working links, so every page gets
+# a navigation with links to other pages chosen by a seeded random generator.
+# The site is the same on every run with the same files and seed.
+class FixtureSite:
+
+    def __init__(self, pages: list[str], links: int = 3, seed: int = 0):
+        if not pages:
+            raise ValueError("Fixture site needs at least one page")
+
+        rng = random.Random(seed)
+        self.pages = []
+
+        for page in pages:
+            targets = [rng.randrange(len(pages)) for _ in range(links)]
+            nav = NAV_TEMPLATE.format(
+                links="".join(
+                    LINK_TEMPLATE.format(link=link, target=target)
+                    for link, target in enumerate(targets)
+                )
+            )
+            self.pages.append(_insert_nav(page, nav).encode("utf-8"))
+
+    def get_page(self, path: str) -> bytes | None:
+        if path in ("", "/"):
+            return self.pages[0]
+
+        if not path.startswith("/p/"):
+            return None
+
+        try:
+            return self.pages[int(path[3:])]
+        except (ValueError, IndexError):
+            return None
+
+
+class FixtureSiteServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, site: FixtureSite, port: int = 0):
+        self.site = site
+        super().__init__(("127.0.0.1", port), FixtureSiteHandler)
+
+    @property
+    def domain(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class FixtureSiteHandler(http.server.BaseHTTPRequestHandler):
+    server: FixtureSiteServer
+
+    def do_GET(self):
+        page = self.server.site.get_page(self.path.split("?")[0])
+
+        if page is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def load_pages(paths: list[str]) -> list[str]:
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.html"))))
+            files.extend(sorted(glob.glob(os.path.join(path, "*.html.gz"))))
+        elif os.path.isfile(path):
+            files.append(path)
+
+    pages = []
+
+    for file in files:
+        # Pages stored with ARTIFACTS_COMPRESSION = "gzip"
+        if file.endswith(".gz"):
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                pages.append(f.read())
+        else:
+            with open(file, encoding="utf-8") as f:
+                pages.append(f.read())
+
+    return pages
+
+
+def _insert_nav(page: str, nav: str) -> str:
+    position = page.rfind("</body>")
+    if position == -1:
+        return page + nav
+    return page[:position] + nav + page[position:]
+
+
+def main():
+    args = parser.parse_args()
+    site = FixtureSite(load_pages(args.paths), args.links, args.seed)
+    server = FixtureSiteServer(site, args.port)
+    print(f"Serving {len(site.pages)} pages at http://{server.domain}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
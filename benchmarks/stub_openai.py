@@ -0,0 +1,270 @@
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import re
+import threading
+import time
+import uuid
+
+import numpy as np
+
+parser = argparse.ArgumentParser(
+    description="Serve deterministic responses to the prompts of the web explorer "
+    "through an OpenAI compatible API"
+)
+parser.add_argument("--port", "-p", type=int, default=8001)
+parser.add_argument(
+    "--latency", "-l", type=float, help="Seconds before every response", default=0.0
+)
+
+EMBEDDING_DIMENSIONS = 1536
+# Tokens counted for every image, the cost of a 1024x1024 screenshot in low detail
+IMAGE_TOKENS = 85
+LINK_PATTERN = re.compile(r"fixture-link-(\d+)")
+PART_PATTERN = re.compile(r"----- PART (\d+)-----")
+
+
+# Answers to the prompts in prompts.yaml for pages of the fixture site. Titles are
+# derived from the screenshot, actions click the navigation links of the site, and
+# every executed action is verified as successful.
+class StubResponder:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def complete(self, request: dict) -> dict:
+        time.sleep(self.latency)
+        prompt_name = identify_prompt(request)
+        text, images = _message_contents(request["messages"])
+        content = None
+        tool_call = None
+
+        if prompt_name == "page_title":
+            image_hash = hashlib.sha256("".join(images).encode("utf-8")).hexdigest()
+            tool_call = (
+                "display_page_title",
+                {"reasoning": "Stub", "title": f"Fixture page {image_hash[:12]}"},
+            )
+        elif prompt_name == "describe_html":
+            links = sorted(set(LINK_PATTERN.findall(text)), key=int)
+            tool_call = (
+                "describe_html",
+                {
+                    "basic_purpose": "A page of the fixture site",
+                    "sections": [
+                        {
+                            "description": "Navigation",
+                            "interactive_elements": [
+                                {"type": "link", "description": f"fixture-link-{link}"}
+                                for link in links
+                            ],
+                            "important_information": [],
+                        }
+                    ],
+                },
+            )
+        elif prompt_name == "suggest_actions":
+            tool_call = ("suggest_actions", {"actions": _suggest_actions(text)})
+        elif prompt_name == "execute_action":
+            # The first message holds the action, later ones are replies to tool calls
+            action_text, _ = _message_contents(request["messages"][:1])
+            link = LINK_PATTERN.search(action_text.split("----- HTML START")[0])
+            if link:
+                tool_call = (
+                    "click_element",
+                    {"reasoning": "Stub", "selector": f"#{link.group(0)}"},
+                )
+            else:
+                content = "The action can not be performed"
+        elif prompt_name == "verify_action":
+            content = "success"
+        else:
+            # No cookie banners and no loading pages on the fixture site
+            content = "no"
+
+        message: dict = {"role": "assistant", "content": content}
+        output = content or ""
+
+        if tool_call is not None:
+            arguments = json.dumps(tool_call[1])
+            output = arguments
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": tool_call[0], "arguments": arguments},
+                }
+            ]
+
+        prompt_tokens = len(text) // 4 + IMAGE_TOKENS * len(images)
+        completion_tokens = len(output) // 4
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "tool_calls" if tool_call else "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embed(self, request: dict) -> dict:
+        time.sleep(self.latency)
+        inputs = request["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        data = []
+
+        for i, text in enumerate(inputs):
+            # Equal titles get equal embeddings, different ones are nearly orthogonal
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8])
+            embedding = np.random.default_rng(seed).standard_normal(
+                EMBEDDING_DIMENSIONS, dtype=np.float32
+            )
+            embedding /= np.linalg.norm(embedding)
+
+            if request.get("encoding_format") == "base64":
+                value = base64.b64encode(embedding.tobytes()).decode("ascii")
+            else:
+                value = embedding.tolist()
+
+            data.append({"object": "embedding", "index": i, "embedding": value})
+
+        tokens = sum(len(text) // 4 for text in inputs)
+
+        return {
+            "object": "list",
+            "data": data,
+            "model": request["model"],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+
+class StubOpenAIServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, responder: StubResponder, port: int = 0):
+        self.responder = responder
+        super().__init__(("127.0.0.1", port), StubOpenAIHandler)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class StubOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    server: StubOpenAIServer
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length))
+        path = self.path.split("?")[0]
+
+        if path.endswith("/chat/completions"):
+            response = self.server.responder.complete(request)
+        elif path.endswith("/embeddings"):
+            response = self.server.responder.embed(request)
+        else:
+            self.send_error(404)
+            return
+
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def identify_prompt(request: dict) -> str:
+    tool_names = {t["function"]["name"] for t in request.get("tools") or []}
+
+    if "display_page_title" in tool_names:
+        return "page_title"
+    if "describe_html" in tool_names:
+        return "describe_html"
+    if "suggest_actions" in tool_names:
+        return "suggest_actions"
+    if "click_element" in tool_names:
+        return "execute_action"
+    if "accept_cookies" in tool_names:
+        return "accept_cookies_selector"
+
+    text, _ = _message_contents(request["messages"][:1])
+
+    if "verifying actions" in text:
+        return "verify_action"
+    if "cookie consent banner" in text:
+        return "search_cookies"
+    if "loading page" in text:
+        return "is_loading"
+    return "unknown"
+
+
+def _message_contents(messages: list[dict]) -> tuple[str, list[str]]:
+    texts = []
+    images = []
+
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for item in content:
+                if item.get("type") == "text":
+                    texts.append(item["text"])
+                elif item.get("type") == "image_url":
+                    images.append(item["image_url"]["url"])
+
+    return "\n".join(texts), images
+
+
+def _suggest_actions(description: str) -> list[dict]:
+    # Every navigation link found in a part of the description is clicked by
+    # one action related to that part
+    parts = PART_PATTERN.split(description)[1:]
+    actions = []
+
+    for part, part_text in zip(parts[::2], parts[1::2]):
+        for link in sorted(set(LINK_PATTERN.findall(part_text)), key=int):
+            actions.append(
+                {
+                    "description": f"Click the link #fixture-link-{link}",
+                    "part": int(part),
+                    "priority": max(1, 10 - int(link)),
+                }
+            )
+
+    return actions
+
+
+def main():
+    args = parser.parse_args()
+    server = StubOpenAIServer(StubResponder(args.latency), args.port)
+    print(f"Serving the stub OpenAI API at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
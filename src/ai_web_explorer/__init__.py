@@ -1,9 +1,16 @@
 import argparse
+import datetime
 import logging
+import os
 
 import openai
 
+from . import config
+from . import journal
+from . import llmcache
+from . import metrics
 from . import loop
+from . import profiler
 from . import webstate
 
 logging.basicConfig(level=logging.INFO)
@@ -53,21 +60,91 @@ parser.add_argument(
     "--restore",
     "-r",
     type=str,
-    help="Restore the exploration from a file",
+    help="Restore the exploration from a JSON file or continue an interrupted exploration from a journal directory",
+    default=None,
+)
+
+parser.add_argument(
+    "--embeddings",
+    "-e",
+    type=str,
+    help="Store title embeddings of the JSON output in a binary .npy file instead of the JSON, read them from it on restore (defaults to the restored file with the .npy extension)",
+    default=None,
+)
+
+parser.add_argument(
+    "--journal",
+    "-j",
+    type=str,
+    help="Directory of the exploration journal, written to resume an interrupted exploration with --restore",
+    default=None,
+)
+
+parser.add_argument(
+    "--cache",
+    "-c",
+    type=str,
+    choices=llmcache.CACHE_MODES,
+    help="LLM response cache mode - reuse responses to identical prompts from previous runs",
+    default=config.LLM_CACHE_MODE,
+)
+
+parser.add_argument(
+    "--workers",
+    "-w",
+    type=int,
+    help="Number of browsers exploring the website in parallel",
+    default=1,
+)
+
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="Run the browser without a window",
+    default=False,
+)
+
+parser.add_argument(
+    "--profile",
+    "-p",
+    type=str,
+    nargs="?",
+    const=config.PROFILE_TRACE_PATH,
+    help="Time the phases of the exploration, log a summary and write a trace viewable in chrome://tracing or Perfetto to the given file (data/profile_trace.json by default)",
     default=None,
 )
 
 
 def main():
     args = parser.parse_args()
+    if args.workers > 1 and args.store_titles:
+        # Titles are confirmed interactively, workers would prompt at the same time
+        parser.error("--store-titles cannot be used with more than one worker")
     domain = args.domain
     url = f"http://{domain}"
     openai_client = openai.Client()
+    config.LLM_CACHE_MODE = args.cache
+    config.BROWSER_HEADLESS = args.headless or config.BROWSER_HEADLESS
+
+    if args.profile:
+        profiler.enable()
 
     logging.info(f"Exploring {domain}")
 
     credentials = args.login.split(":") if args.login else [None, None]
 
+    if args.restore and os.path.isdir(args.restore):
+        # Continue writing to the journal the exploration is restored from
+        journal_path = args.restore
+    elif args.journal:
+        journal_path = args.journal
+    elif config.JOURNAL_ENABLED:
+        journal_path = os.path.join(
+            config.JOURNALS_PATH, datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        )
+    else:
+        journal_path = None
+
     loop_config = loop.LoopConfig(
         iterations=args.iterations,
         store_titles=args.store_titles,
@@ -75,20 +152,40 @@ def main():
         username=credentials[0],
         password=credentials[1],
         additional_info=args.additional_info,
+        journal_path=journal_path,
     )
 
-    explore_loop = loop.ExploreLoop(domain, url, openai_client, loop_config)
-    
-    if args.restore:
-        webstates = webstate.load_states_from_file(args.restore)
-        explore_loop.set_webstates(webstates)
+    if args.workers > 1:
+        explore_loop = loop.ParallelExploreLoop(
+            domain, url, openai_client, loop_config, args.workers
+        )
+    else:
+        explore_loop = loop.ExploreLoop(domain, url, openai_client, loop_config)
 
-    explore_loop.start()
+    if args.restore and os.path.isdir(args.restore):
+        webstates = journal.load_journal(args.restore)
+        explore_loop.set_webstates(webstates)
+    elif args.restore:
+        webstates = webstate.load_states_from_file(args.restore, args.embeddings)
+        explore_loop.set_webstates(webstates)
 
-    if args.output == "jsonsimple":
-        explore_loop.print_json(True)
-    elif args.output == "json":
-        explore_loop.print_json(False)
-    elif args.output == "digraph":
-        explore_loop.print_graph()
-    explore_loop.stop()
+    try:
+        explore_loop.start()
+
+        if args.output == "jsonsimple":
+            explore_loop.print_json(True)
+        elif args.output == "json":
+            explore_loop.print_json(False, args.embeddings)
+        elif args.output == "digraph":
+            explore_loop.print_graph()
+    finally:
+        explore_loop.stop()
+
+        metrics.get_registry().log_summary()
+        metrics.get_registry().dump()
+
+        if (profile := profiler.get_profiler()) is not None:
+            logging.info(
+                f"Time spent in the exploration phases:\n{profile.format_summary()}"
+            )
+            profile.write_trace(args.profile)
@@ -0,0 +1,135 @@
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from . import background
+from . import config
+
+COMPRESSIONS = ("none", "gzip")
+
+
+# HTML and screenshots of visited pages stored by the hash of their content, so a
+# page visited many times is stored once. Every visit is recorded in an index
+# with the hashes of its HTML and screenshot. Hashing and writing is done by a
+# background thread.
+class ArtifactStore(background.BackgroundWriter):
+
+    def __init__(
+        self,
+        htmls_path: str = config.HTMLS_PATH,
+        screenshots_path: str = config.SCREENSHOTS_PATH,
+        index_path: str = config.ARTIFACTS_INDEX_PATH,
+        compression: str = config.ARTIFACTS_COMPRESSION,
+        queue_size: int = config.ARTIFACTS_QUEUE_SIZE,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown artifact compression {compression}")
+
+        self.htmls_path = htmls_path
+        self.screenshots_path = screenshots_path
+        self.index_path = index_path
+        self._compression = compression
+        self._stored: set[str] = set()
+        self._blobs_written = 0
+        self._blobs_skipped = 0
+        super().__init__("artifact-writer", queue_size)
+
+    def store_page(self, visit_id: str, url: str, html: str, screenshot: bytes):
+        self.put(
+            {
+                "visit_id": visit_id,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "url": url,
+                "html": html,
+                "screenshot": screenshot,
+            }
+        )
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        super().close()
+        logging.info(
+            f"Artifact store wrote {self._blobs_written} files, "
+            f"skipped {self._blobs_skipped} duplicates"
+        )
+
+    def html_path(self, html_hash: str) -> str:
+        extension = ".html.gz" if self._compression == "gzip" else ".html"
+        return os.path.join(self.htmls_path, html_hash + extension)
+
+    def screenshot_path(self, screenshot_hash: str) -> str:
+        # Screenshots are already compressed PNGs
+        return os.path.join(self.screenshots_path, screenshot_hash + ".png")
+
+    def _write_batch(self, visits: list[dict]) -> None:
+        # A page that fails to be stored does not prevent storing the others
+        for visit in visits:
+            try:
+                self._store(visit)
+            except Exception:
+                logging.exception(f"Failed to store page {visit['visit_id']}")
+
+    def _store(self, visit: dict) -> None:
+        html_bytes = visit["html"].encode("utf-8")
+        html_hash = hashlib.sha256(html_bytes).hexdigest()
+        screenshot_hash = hashlib.sha256(visit["screenshot"]).hexdigest()
+
+        self._write_blob(
+            self.html_path(html_hash),
+            html_bytes,
+            key=html_hash,
+            compress=self._compression == "gzip",
+        )
+
+        self._write_blob(
+            self.screenshot_path(screenshot_hash),
+            visit["screenshot"],
+            key=screenshot_hash,
+        )
+
+        with open(self.index_path, "a") as f:
+            record = {
+                "visit_id": visit["visit_id"],
+                "timestamp": visit["timestamp"],
+                "url": visit["url"],
+                "html": html_hash,
+                "screenshot": screenshot_hash,
+            }
+            f.write(json.dumps(record) + "\n")
+
+    def _write_blob(
+        self, path: str, content: bytes, key: str, compress: bool = False
+    ) -> None:
+        if key in self._stored or os.path.exists(path):
+            self._stored.add(key)
+            self._blobs_skipped += 1
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        path_tmp = f"{path}.tmp"
+
+        with open(path_tmp, "wb") as f:
+            f.write(gzip.compress(content) if compress else content)
+
+        os.replace(path_tmp, path)
+        self._stored.add(key)
+        self._blobs_written += 1
+
+
+_store: ArtifactStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(
+                config.HTMLS_PATH, config.SCREENSHOTS_PATH, config.ARTIFACTS_INDEX_PATH
+            )
+        return _store
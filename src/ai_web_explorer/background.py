@@ -0,0 +1,93 @@
+import abc
+import atexit
+import logging
+import queue
+import threading
+import typing
+
+
+# Items written by a background thread, so producers only put them into a queue.
+# The queue is bounded, if the thread falls behind, producers wait instead of
+# losing items. Items that fail to be written are dropped with a logged error,
+# the thread keeps running until the writer is closed. Items still in the queue
+# are written when the program exits.
+class BackgroundWriter(abc.ABC):
+
+    def __init__(self, name: str, queue_size: int):
+        self.name = name
+        self._queue: queue.Queue[typing.Any] = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._closed = False
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, item: typing.Any) -> None:
+        if self._closed:
+            raise ValueError(f"{self.name} is closed")
+        self._queue.put(item)
+
+    def flush(self) -> None:
+        # Waits until all items put so far are written
+        if self._closed:
+            raise ValueError(f"{self.name} is closed")
+        flushed = threading.Event()
+        self._queue.put(_Flush(flushed))
+        flushed.wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # Writes all items waiting in the queue at once
+    @abc.abstractmethod
+    def _write_batch(self, items: list) -> None:
+        pass
+
+    # Called by the thread after the last batch is written
+    def _finish(self) -> None:
+        pass
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            items = []
+            flushes = []
+            stop = False
+
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, _Flush):
+                    flushes.append(item.event)
+                else:
+                    items.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if items:
+                try:
+                    self._write_batch(items)
+                except Exception:
+                    logging.exception(f"{self.name} dropped {len(items)} items")
+
+            for event in flushes:
+                event.set()
+
+            if stop:
+                try:
+                    self._finish()
+                except Exception:
+                    logging.exception(f"{self.name} failed to finish")
+                return
+
+
+class _Flush(typing.NamedTuple):
+    event: threading.Event
+
+
+_STOP = object()
@@ -10,6 +10,16 @@ TITLES_PATH = os.path.join(DATA_PATH, "titles.jsonl")
 HTMLS_PATH = os.path.join(DATA_PATH, "htmls")
 SCREENSHOTS_PATH = os.path.join(DATA_PATH, "screenshots")
 
+# HTML and screenshots are stored once per unique content, named by its SHA-256 hash.
+# The index maps every page visit to the hashes.
+ARTIFACTS_INDEX_PATH = os.path.join(DATA_PATH, "pages.jsonl")
+
+# Compression of stored HTML - "none" or "gzip"
+ARTIFACTS_COMPRESSION = "none"
+
+# Maximum number of pages waiting to be stored by the background writer
+ARTIFACTS_QUEUE_SIZE = 64
+
 # Action execution settings
 ACTION_NAMES_PATH = os.path.join(DATA_PATH, "actions.txt")
 ACTIONS_SCREENSHOTS_PATH = os.path.join(DATA_PATH, "actions_screenshots")
@@ -23,25 +33,155 @@ TEMPERATURE_DEFAULT = 0.1
 PROMPTS_PATH = os.path.join(RESOURCES_PATH, "prompts.yaml")
 PROMPTS_PATH_TEST = os.path.join(RESOURCES_PATH, "prompts_test.yaml")
 
+# Maximum number of LLM requests sent concurrently for parts of a single page
+LLM_MAX_WORKERS = 4
+
+# Screenshots sent with prompts are downscaled and re-encoded according to the image
+# section of each prompt (requires the Pillow package)
+IMAGE_QUALITY_DEFAULT = 85
+
+# Number of encoded screenshots kept in memory, the same screenshot is often sent
+# with several prompts
+IMAGE_CACHE_SIZE = 32
+
+# Pixels around the changed region kept when cropping screenshots of an action
+IMAGE_CROP_MARGIN = 32
+
 PROMPT_LOGGING_ENABLED = True
 PROMPT_LOGS_PATH = os.path.join(DATA_PATH, "prompt_logs.jsonl")
 
+# Maximum number of prompt log records waiting to be written by the background writer
+PROMPT_LOGS_QUEUE_SIZE = 1000
+
+# The prompt log is rotated when it reaches this size in bytes, rotated logs are
+# compressed - "none", "gzip" or "zstd" (requires the zstandard package)
+PROMPT_LOGS_MAX_SIZE = 100 * 1024 * 1024
+PROMPT_LOGS_COMPRESSION = "gzip"
+
+# LLM response cache - "disabled", "read" (only replay stored responses) or "readwrite"
+LLM_CACHE_MODE = "disabled"
+LLM_CACHE_PATH = os.path.join(DATA_PATH, "llm_cache")
+
+# Maximum size of the LLM response cache in bytes, oldest responses are removed first
+LLM_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+
+# Maximum age of a cached LLM response in seconds
+LLM_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Prices of models in USD per 1M input and output tokens, used for the LLM metrics
+# Fine-tuned (ft:<model>:...) and dated models are priced as their base model, other
+# models missing from the table get MODEL_PRICE_DEFAULT
+MODEL_PRICES = {
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+MODEL_PRICE_DEFAULT = MODEL_PRICES["gpt-4o-mini"]
+
+# LLM metrics per prompt written at the end of an exploration
+METRICS_JSON_PATH = os.path.join(DATA_PATH, "metrics.json")
+METRICS_PROMETHEUS_PATH = os.path.join(DATA_PATH, "metrics.prom")
+
+# Upper bounds of the LLM latency histogram buckets in seconds
+METRICS_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+
+# Trace of the explore loop phases written with --profile, viewable in chrome://tracing
+# or Perfetto
+PROFILE_TRACE_PATH = os.path.join(DATA_PATH, "profile_trace.json")
+
+# Exploration journal - changes of the state graph are written as they happen, so an
+# interrupted exploration can be resumed with --restore. The journal is written to
+# --journal or, if enabled, to a new directory in JOURNALS_PATH for every exploration.
+JOURNAL_ENABLED = False
+JOURNALS_PATH = os.path.join(DATA_PATH, "journals")
+
+# Minimum number of journal records after which the journal is compacted into
+# a snapshot, the interval grows with the number of records written so far
+JOURNAL_COMPACT_EVERY = 100
+
 # Browser settings
 BROWSER_SIZE = (1024, 1024)
+BROWSER_HEADLESS = False
+
+# Cost of resetting the browser to the start page when planning the path to the next
+# action, in the same units as the cost of a transition (number of replayed tool calls)
+RESET_COST = 3
+
 HTML_PART_LENGTH = 40000
+# Maximum number of (estimated) tokens in a part of HTML sent to the LLM
+HTML_PART_TOKENS = 12000
 PLAYWRIGHT_TIMEOUT = 5000
 
-# Time to wait to check if the page is loaded
+# Where the page HTML is cleaned - "python" (BeautifulSoup) or "browser" (JavaScript in
+# the page, only the cleaned HTML is transferred from the browser)
+HTML_CLEANING_ENGINE = "python"
+
+# Time to wait to check if the page is loaded, only used to report the time saved by
+# waiting for the page to settle instead
 ENSURE_LOADED_SLEEP_TIME = 2
 
 # Number of times to check if the page is loaded if the previous check failed
 ENSURE_LOADED_MAX_TRIES = 3
 
+# Whether signals from the page (ready state, pending requests, spinners, layout shifts)
+# are used to check if the page is loading, the LLM is asked only if they are ambiguous.
+# Disabled until the signals are evaluated on captured samples (tests/ai/capture_loading.py)
+LOADING_SIGNALS_ENABLED = False
+
+# Pages with less visible text are considered empty, e.g. a single page application
+# that did not render yet
+LOADING_MIN_TEXT_LENGTH = 200
+
+# Layout shifts in the last LOADING_LAYOUT_SHIFT_WINDOW seconds larger than
+# LOADING_LAYOUT_SHIFT_THRESHOLD (cumulative layout shift score) mean content is still
+# being added to the page
+LOADING_LAYOUT_SHIFT_WINDOW = 1
+LOADING_LAYOUT_SHIFT_THRESHOLD = 0.1
+
+# Title embedding settings
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_PATH = os.path.join(DATA_PATH, "embeddings_cache")
+
+# Number of title embeddings kept in memory
+EMBEDDING_CACHE_SIZE = 10000
+
+# Maximum number of titles embedded in a single request
+EMBEDDING_BATCH_SIZE = 512
+
 # Minimum cosine similarity between two titles to consider them to be the same
 TITLE_SIMILARITY_THRESHOLD = 0.92
 
+# How similar states are searched for - "numpy" (exact search) or "hnswlib" (approximate
+# nearest neighbours, requires the hnswlib package, useful for tens of thousands of states)
+STATE_INDEX_BACKEND = "numpy"
+
+# Exploration loop settings
+# Whether the browser is reset with the session of the current page (e.g. a logged in
+# user) instead of the session of the start page when backtracking to another state
+RESET_KEEP_SESSION = False
+
 # If performing a browser action fails, how many times to retry
 ACTION_MAX_TRIES = 5
 
-# Time to wait between browser actions
+# Time to wait between browser actions, only used to report the time saved by waiting
+# for the page to settle instead
 ACTION_SLEEP_TIME = 1
+
+# Time to wait for the page to load before accepting cookies, only used to report the
+# time saved by waiting for the page to settle instead
+PAGE_LOAD_SLEEP_TIME = 5
+
+# The page is settled when it is loaded, has no pending requests and running animations
+# and did not change for SETTLE_QUIET_TIME seconds, but at most SETTLE_TIMEOUT seconds
+# are waited
+SETTLE_QUIET_TIME = 0.5
+SETTLE_TIMEOUT = 10
+
+# A wait used instead of a fixed sleep lasts at most SETTLE_TIMEOUT_FACTOR times the sleep
+SETTLE_TIMEOUT_FACTOR = 2
+
+# Requests pending for longer than SETTLE_REQUEST_TIMEOUT seconds (long-polling, analytics
+# beacons) are not waited for
+SETTLE_REQUEST_TIMEOUT = 2
+
+# How often the page is checked when waiting for it to settle in seconds
+SETTLE_POLLING_TIME = 0.05
@@ -1,35 +1,59 @@
+import concurrent.futures
+
 import openai
 import playwright.sync_api
 import json
 import logging
 
+from . import config
 from . import promptrepo
 from . import html
+from . import profiler
 
 
-def accept_cookies_if_present(client: openai.Client, page: playwright.sync_api.Page):
+@profiler.traced("accept_cookies")
+def accept_cookies_if_present(
+    client: openai.Client, page: playwright.sync_api.Page
+) -> bool:
+    # Returns whether a cookie banner was found and accepted
     prompt_search_cookies = promptrepo.get_prompt("search_cookies")
-    has_cookies = False
-    for html_part in html.iterate_html(page):
-        response = prompt_search_cookies.execute_prompt(
-            client, image_bytes=page.screenshot(), html_part=html_part
-        )
-        if response.message.content and "yes" in response.message.content.lower():
-            has_cookies = True
-            break
-
-    if not has_cookies:
+    screenshot = page.screenshot()
+    html_part_cookies = None
+
+    pool = concurrent.futures.ThreadPoolExecutor(config.LLM_MAX_WORKERS)
+
+    try:
+        futures = {
+            pool.submit(
+                profiler.propagate(prompt_search_cookies.execute_prompt),
+                client,
+                image_bytes=screenshot,
+                html_part=html_part,
+            ): html_part
+            for html_part in html.iterate_html(page)
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            response = future.result()
+            if response.message.content and "yes" in response.message.content.lower():
+                html_part_cookies = futures[future]
+                break
+    finally:
+        # Parts that were not checked yet are not needed once a banner is found
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if html_part_cookies is None:
         logging.info("No cookie banner found")
-        return
+        return False
 
     prompt_accept_selector = promptrepo.get_prompt("accept_cookies_selector")
     response = prompt_accept_selector.execute_prompt(
-        client, image_bytes=page.screenshot(), html_part=html_part
+        client, image_bytes=screenshot, html_part=html_part_cookies
     )
 
     if not response.message.tool_calls or len(response.message.tool_calls) == 0:
         logging.error("No tool calls in response when accepting cookies")
-        return
+        return False
 
     args_str = response.message.tool_calls[0].function.arguments
     args = json.loads(args_str)
@@ -37,3 +61,4 @@ def accept_cookies_if_present(client: openai.Client, page: playwright.sync_api.P
 
     logging.info(f"Accepting cookies with selector `{selector}`")
     page.click(selector)
+    return True
@@ -1,3 +1,4 @@
+import concurrent.futures
 import json
 import logging
 
@@ -5,9 +6,14 @@ import openai
 import playwright.sync_api
 import yaml
 
+from . import artifacts
 from . import promptrepo
 from . import html
 from . import config
+from . import embeddings
+from . import loading
+from . import metrics
+from . import profiler
 from . import webstate
 import uuid
 
@@ -23,11 +29,14 @@ class Describer:
         self._page = page
         self._client = client
         self._additional_info = additional_info
+        # Whether the last loading check was answered by the LLM
+        self.loading_checked_by_llm = False
 
+    @profiler.traced("title")
     def get_title(self, confirm: bool = True, store_title: bool = True) -> str:
         website_uuid = str(uuid.uuid4())
         page_html = html.get_full_html(self._page)[: config.HTML_PART_LENGTH * 2]
-        screenshot = self._page.screenshot()
+        screenshot = self._screenshot()
         prompt = promptrepo.get_prompt("page_title")
         logging.info(f"Getting title for webpage")
 
@@ -65,36 +74,48 @@ class Describer:
 
     def get_title_embedding(self, title: str) -> list[float]:
         logging.info(f"Getting embedding for title: {title}")
-        response = self._client.embeddings.create(
-            model="text-embedding-3-small", input=[title]
-        )
-        return response.data[0].embedding
+        with profiler.span("title_embedding"):
+            return self.get_title_embeddings([title])[0]
+
+    def get_title_embeddings(self, titles: list[str]) -> list[list[float]]:
+        return embeddings.embed_titles(self._client, titles)
 
+    @profiler.traced("description")
     def get_description(self) -> list[dict]:
-        description = []
         prompt = promptrepo.get_prompt("describe_html")
         logging.info(f"Getting description for webpage")
-
-        for part in html.iterate_html(self._page):
-            response = prompt.execute_prompt(
-                self._client, image_bytes=self._page.screenshot(), html_part=part
+        screenshot = self._screenshot()
+        parts = list(html.iterate_html(self._page))
+
+        with concurrent.futures.ThreadPoolExecutor(config.LLM_MAX_WORKERS) as pool:
+            return list(
+                pool.map(
+                    profiler.propagate(
+                        lambda part: self._describe_part(prompt, screenshot, part)
+                    ),
+                    parts,
+                )
             )
 
-            if not response.message.tool_calls or len(response.message.tool_calls) == 0:
-                raise ValueError("No tool calls in response when getting description")
-
-            args_str = response.message.tool_calls[0].function.arguments
+    def _describe_part(
+        self, prompt: promptrepo.Prompt, screenshot: bytes, part: str
+    ) -> dict:
+        response = prompt.execute_prompt(
+            self._client, image_bytes=screenshot, html_part=part
+        )
 
-            try:
-                args = json.loads(args_str)
-            except json.JSONDecodeError as e:
-                logging.error(f"Error decoding JSON: {args_str}")
-                raise e
+        if not response.message.tool_calls or len(response.message.tool_calls) == 0:
+            raise ValueError("No tool calls in response when getting description")
 
-            description.append(args)
+        args_str = response.message.tool_calls[0].function.arguments
 
-        return description
+        try:
+            return json.loads(args_str)
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON: {args_str}")
+            raise e
 
+    @profiler.traced("suggest_actions")
     def get_actions(self, title: str, description: list[dict]) -> list[webstate.Action]:
         description_str = "\n\n".join(
             [
@@ -108,7 +129,7 @@ class Describer:
 
         response = prompt.execute_prompt(
             self._client,
-            image_bytes=self._page.screenshot(),
+            image_bytes=self._screenshot(),
             description=description_str,
             url=self._page.url,
             title=title,
@@ -139,20 +160,34 @@ class Describer:
 
         return actions
 
-    def is_loading(self) -> bool:
+    @profiler.traced("is_loading")
+    def is_loading(self, retry: bool = False) -> bool:
+        # retry means the LLM was already asked about the same page
         logging.info(f"Checking if webpage is loading")
+        self.loading_checked_by_llm = False
+
+        if config.LOADING_SIGNALS_ENABLED:
+            signals = loading.get_loading_signals(self._page)
+            is_loading = loading.classify_loading(signals) if signals else None
+            if is_loading is not None:
+                logging.info(f"Page signals say the page is loading: {is_loading}")
+                return is_loading
+            logging.info(f"Page signals are ambiguous: {signals}")
+
         prompt = promptrepo.get_prompt("is_loading")
-        response = prompt.execute_prompt(
-            self._client, image_bytes=self._page.screenshot()
-        )
+        if retry:
+            metrics.get_registry().record_retry(prompt.name)
+        self.loading_checked_by_llm = True
+        response = prompt.execute_prompt(self._client, image_bytes=self._screenshot())
         response_text = response.message.content
         return response_text is not None and "yes" in response_text.lower()
 
+    @profiler.traced("screenshot")
+    def _screenshot(self) -> bytes:
+        return self._page.screenshot()
+
     def _log_page(self, website_uuid: str, page_html: str, screenshot: bytes) -> None:
         logging.info(f"Logging webpage with UUID: {website_uuid}")
-
-        with open(config.HTMLS_PATH + f"/{website_uuid}.html", "w") as f:
-            f.write(page_html)
-
-        with open(config.SCREENSHOTS_PATH + f"/{website_uuid}_start.png", "wb") as f:
-            f.write(screenshot)
+        artifacts.get_store().store_page(
+            website_uuid, self._page.url, page_html, screenshot
+        )
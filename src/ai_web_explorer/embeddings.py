@@ -0,0 +1,112 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import openai
+
+from . import config
+from . import profiler
+
+
+# Title embeddings kept in an in-memory LRU backed by one JSON file per
+# (model, title) on disk, so revisited pages do not need an API round trip
+class EmbeddingCache:
+
+    def __init__(self, path: str, max_size: int = config.EMBEDDING_CACHE_SIZE):
+        self.path = path
+        self._max_size = max_size
+        self._memory: collections.OrderedDict[tuple[str, str], list[float]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, model: str, title: str) -> list[float] | None:
+        with self._lock:
+            embedding = self._memory.get((model, title))
+            if embedding is not None:
+                self._memory.move_to_end((model, title))
+                return embedding
+
+        try:
+            with open(self._entry_path(model, title)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            logging.warning(f"Ignoring corrupted embedding cache entry: {e}")
+            return None
+
+        if entry["title"] != title:
+            return None
+
+        self.put(model, title, entry["embedding"], persist=False)
+        return entry["embedding"]
+
+    def put(
+        self, model: str, title: str, embedding: list[float], persist: bool = True
+    ) -> None:
+        with self._lock:
+            self._memory[(model, title)] = embedding
+            self._memory.move_to_end((model, title))
+            while len(self._memory) > self._max_size:
+                self._memory.popitem(last=False)
+
+        if not persist:
+            return
+
+        entry_path = self._entry_path(model, title)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        entry_tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+
+        with open(entry_tmp_path, "w") as f:
+            json.dump({"title": title, "embedding": embedding}, f)
+
+        os.replace(entry_tmp_path, entry_path)
+
+    def _entry_path(self, model: str, title: str) -> str:
+        key = hashlib.sha256(title.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, model, key[:2], f"{key}.json")
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH)
+        return _cache
+
+
+def embed_titles(client: openai.OpenAI, titles: list[str]) -> list[list[float]]:
+    embeddings_cache = get_cache()
+    title_embeddings = {}
+
+    for title in titles:
+        embedding = embeddings_cache.get(config.EMBEDDING_MODEL, title)
+        if embedding is not None:
+            title_embeddings[title] = embedding
+
+    titles_missing = list(dict.fromkeys(t for t in titles if t not in title_embeddings))
+    logging.info(
+        f"Embedding {len(titles_missing)} titles, {len(titles) - len(titles_missing)} cached"
+    )
+
+    for i in range(0, len(titles_missing), config.EMBEDDING_BATCH_SIZE):
+        batch = titles_missing[i : i + config.EMBEDDING_BATCH_SIZE]
+        with profiler.span("embedding_request", titles=len(batch)):
+            response = client.embeddings.create(
+                model=config.EMBEDDING_MODEL, input=batch
+            )
+        for data in response.data:
+            title_embeddings[batch[data.index]] = data.embedding
+            embeddings_cache.put(
+                config.EMBEDDING_MODEL, batch[data.index], data.embedding
+            )
+
+    return [title_embeddings[title] for title in titles]
@@ -1,6 +1,5 @@
 import json
 import logging
-import time
 
 import openai
 from openai.types import chat
@@ -10,6 +9,10 @@ from . import webstate
 from . import promptrepo
 from . import html
 from . import config
+from . import llmcache
+from . import metrics
+from . import profiler
+from . import settle
 
 
 class Executor:
@@ -21,8 +24,10 @@ class Executor:
         username: str | None,
         password: str | None,
         additional_info: str | None = None,
+        settler: settle.Settler | None = None,
     ) -> None:
         self._page = page
+        self._settler = settler or settle.Settler(page)
         self._client = client
         self._additional_info = additional_info
 
@@ -38,34 +43,35 @@ class Executor:
         prompt_verify = promptrepo.get_prompt("verify_action")
 
         logging.info(f"Executing action: {action.description}")
-        messages: list[chat.ChatCompletionMessageParam] = []
         tool_calls_all = []
 
-        for i, html_part in enumerate(html.iterate_html(self._page)):
-            if i != action.part:
-                continue
-
-            messages.append(
-                {
-                    "role": "user",
-                    "content": prompt.prompt_with_data(
-                        action=action.description,
-                        html=html_part,
-                        login_prompt=self._login_prompt,
-                        additional_info=self._additional_info,
-                    ),
-                }
-            )
-
-        if len(messages) == 0:
-            logging.error("No messages to send in response")
+        try:
+            html_part = html.get_html_chunks(self._page)[action.part]
+        except IndexError:
+            logging.error(f"HTML part {action.part} does not exist on the page")
             return False, []
 
-        screenshot_before = self._page.screenshot()
-
-        for _ in range(config.ACTION_MAX_TRIES):
-
-            response = self._client.chat.completions.create(
+        messages: list[chat.ChatCompletionMessageParam] = [
+            {
+                "role": "user",
+                "content": prompt.prompt_with_data(
+                    action=action.description,
+                    html=html_part,
+                    login_prompt=self._login_prompt,
+                    additional_info=self._additional_info,
+                ),
+            }
+        ]
+
+        screenshot_before = self._screenshot()
+
+        for attempt in range(config.ACTION_MAX_TRIES):
+            if attempt > 0:
+                metrics.get_registry().record_retry(prompt.name)
+
+            response = llmcache.create_completion(
+                self._client,
+                prompt_name=prompt.name,
                 model=prompt.model,
                 messages=messages,
                 temperature=prompt.temperature,
@@ -85,7 +91,8 @@ class Executor:
 
             for tool_call in tool_calls:
                 try:
-                    response_message = self._execute_tool_call(tool_call)
+                    with profiler.span("tool_call", function=tool_call.function.name):
+                        response_message = self._execute_tool_call(tool_call)
                     tool_calls_all.append(tool_call)
                 except playwright.sync_api.TimeoutError:
                     logging.error("Timeout error when executing action")
@@ -106,7 +113,7 @@ class Executor:
                     }
                 messages.append(response_message)  # type: ignore
 
-            screenshot_after = self._page.screenshot()
+            screenshot_after = self._screenshot()
 
             if screenshot_before == screenshot_after:
                 messages.append(
@@ -114,11 +121,12 @@ class Executor:
                 )
                 continue
 
-            response = prompt_verify.execute_prompt(
-                self._client,
-                image_bytes=[screenshot_before, screenshot_after],
-                action=action.description,
-            )
+            with profiler.span("verify"):
+                response = prompt_verify.execute_prompt(
+                    self._client,
+                    image_bytes=[screenshot_before, screenshot_after],
+                    action=action.description,
+                )
 
             if (
                 response.message.content
@@ -137,8 +145,13 @@ class Executor:
 
     def replicate_tool_calls(self, tool_calls: list):
         for tool_call in tool_calls:
-            time.sleep(1)
-            self._execute_tool_call(tool_call)
+            self._settler.settle(replaced=config.ACTION_SLEEP_TIME)
+            with profiler.span("tool_call", function=tool_call.function.name):
+                self._execute_tool_call(tool_call)
+
+    @profiler.traced("screenshot")
+    def _screenshot(self) -> bytes:
+        return self._page.screenshot()
 
     def _execute_tool_call(self, tool_call):
         args = json.loads(tool_call.function.arguments)
@@ -162,5 +175,5 @@ class Executor:
             )
         else:
             raise ValueError(f"Unknown function {tool_call.function.name}")
-        time.sleep(1)
+        self._settler.settle(replaced=config.ACTION_SLEEP_TIME)
         return {"role": "tool", "content": "OK", "tool_call_id": tool_call.id}
@@ -1,50 +1,191 @@
+import argparse
+import collections
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+
+from . import config
 from . import promptrepo
-import json
-import sys
 
 logging.basicConfig(level=logging.INFO)
 
+parser = argparse.ArgumentParser(
+    description="Create train and test datasets for fine-tuning from stored titles"
+)
+parser.add_argument("train_file", help="Output JSONL file with training examples")
+parser.add_argument("test_file", help="Output JSONL file with test examples")
+parser.add_argument(
+    "--input",
+    "-i",
+    type=str,
+    help="JSONL file with titles stored by the explorer",
+    default=config.TITLES_PATH,
+)
+parser.add_argument(
+    "--test-fraction",
+    "-f",
+    type=float,
+    help="Fraction of pages used as test examples",
+    default=0.25,
+)
+parser.add_argument(
+    "--shards",
+    "-s",
+    type=int,
+    help="Number of files each dataset is split into, named <file>-00000-of-0000N",
+    default=1,
+)
+parser.add_argument(
+    "--workers",
+    "-w",
+    type=int,
+    help="Number of processes formatting the prompts",
+    default=1,
+)
+parser.add_argument(
+    "--batch-size",
+    "-b",
+    type=int,
+    help="Number of pages sent to a process at once",
+    default=256,
+)
 
-def main():
-    train_file = sys.argv[1]
-    test_file = sys.argv[2]
 
-    logging.info("Creating dataset for fine-tuning")
+# Every page is identified by the hash of its title and URL. Duplicates are
+# skipped by the hash before their prompts are formatted and the hash decides
+# whether the page is a test example and which shard it goes to, so adding pages
+# to the input never moves pages already in the datasets to another split.
+class DatasetWriter:
+
+    def __init__(
+        self, train_file: str, test_file: str, test_fraction: float, shards: int
+    ):
+        if not 0.0 <= test_fraction <= 1.0:
+            raise ValueError("Test fraction must be between 0 and 1")
+        if shards < 1:
+            raise ValueError("Number of shards must be at least 1")
+
+        self._test_threshold = int(test_fraction * 2**64)
+        self._shards = shards
+        self._seen: set[bytes] = set()
+        self._files = {
+            "train": [open(p, "w") for p in shard_paths(train_file, shards)],
+            "test": [open(p, "w") for p in shard_paths(test_file, shards)],
+        }
+        self.counts: collections.Counter[str] = collections.Counter()
+
+    def add_page(self, page_hash: bytes) -> bool:
+        # Returns False for a page already in the datasets
+        key = page_hash[:16]
+        if key in self._seen:
+            self.counts["duplicate"] += 1
+            return False
+        self._seen.add(key)
+        return True
+
+    def write(self, page_hash: bytes, record_json: str) -> None:
+        is_test = int.from_bytes(page_hash[:8], "big") < self._test_threshold
+        split = "test" if is_test else "train"
+        shard = int.from_bytes(page_hash[8:16], "big") % self._shards
+        self._files[split][shard].write(record_json + "\n")
+        self.counts[split] += 1
+
+    def close(self) -> None:
+        for files in self._files.values():
+            for f in files:
+                f.close()
+
+
+def shard_paths(path: str, shards: int) -> list[str]:
+    if shards == 1:
+        return [path]
+    base, extension = os.path.splitext(path)
+    return [f"{base}-{i:05d}-of-{shards:05d}{extension}" for i in range(shards)]
+
+
+def page_hash(page: dict) -> bytes:
+    key = json.dumps([page["title"], page["url"]])
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def format_batch(pages: list[tuple[bytes, dict]]) -> list[tuple[bytes, str]]:
     prompt_base = promptrepo.get_prompt("page_title")
-    explored_pages = set()
     records = []
 
-    with open("data/titles.jsonl") as fd:
-        while line := fd.readline():
-            page = json.loads(line)
-            page_key = (page["title"], page["url"])
+    for key, page in pages:
+        prompt = prompt_base.prompt_with_data(html=page["html"])
+        response = json.dumps({"title": page["title"]})
+
+        record = {
+            "messages": [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response},
+            ],
+        }
+
+        records.append((key, json.dumps(record)))
 
-            if page_key in explored_pages:
+    return records
+
+
+def iterate_batches(path: str, batch_size: int, writer: DatasetWriter):
+    # Pages already in the datasets are skipped before they are formatted
+    with open(path) as fd:
+        batch = []
+        for line in fd:
+            if not line.strip():
+                continue
+            page = json.loads(line)
+            key = page_hash(page)
+            if not writer.add_page(key):
                 continue
+            batch.append((key, page))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
 
-            explored_pages.add(page_key)
-            prompt = prompt_base.prompt_with_data(html=page["html"])
-            response = json.dumps({"title": page["title"]})
+def main():
+    args = parser.parse_args()
 
-            record = {
-                "messages": [
-                    {"role": "user", "content": prompt},
-                    {"role": "assistant", "content": response},
-                ],
-            }
+    logging.info(f"Creating dataset for fine-tuning from {args.input}")
+    writer = DatasetWriter(
+        args.train_file, args.test_file, args.test_fraction, args.shards
+    )
+    batches = iterate_batches(args.input, args.batch_size, writer)
 
-            records.append(record)
+    try:
+        if args.workers <= 1:
+            for batch in batches:
+                for item in format_batch(batch):
+                    writer.write(*item)
+        else:
+            with multiprocessing.Pool(args.workers) as pool:
+                # Pool.imap would read the whole input into its task queue, only
+                # a few batches per process are read ahead instead. Results are
+                # written in input order, so the output does not depend on timing.
+                pending: collections.deque = collections.deque()
 
-    train_size = int(len(records) * 0.75)
+                for batch in batches:
+                    pending.append(pool.apply_async(format_batch, (batch,)))
+                    if len(pending) >= args.workers * 2:
+                        for item in pending.popleft().get():
+                            writer.write(*item)
 
-    with open(train_file, "w") as fd:
-        for record in records[:train_size]:
-            fd.write(json.dumps(record) + "\n")
+                while pending:
+                    for item in pending.popleft().get():
+                        writer.write(*item)
+    finally:
+        writer.close()
 
-    with open(test_file, "w") as fd:
-        for record in records[train_size:]:
-            fd.write(json.dumps(record) + "\n")
+    logging.info(
+        f"Written {writer.counts['train']} training and {writer.counts['test']} "
+        f"test examples, skipped {writer.counts['duplicate']} duplicates"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+import dataclasses
+import heapq
+import itertools
+import logging
+import threading
+import uuid
+
+from . import config
+from . import journal
+from . import webstate
+
+
+@dataclasses.dataclass
+class ActionPlan:
+    action: webstate.Action
+    # Transitions to replay to get to the state of the action
+    transitions: list[webstate.StateTransition]
+    # Whether the transitions start from the start page instead of the current state
+    reset: bool
+    cost: float
+
+
+# Graph of explored states shared by all exploration workers. Actions are
+# claimed before they are executed so no two workers perform the same one.
+# A claimed action stays in flight until the state it led to is added, a worker
+# without an available action waits for actions in flight as they may lead to
+# new states.
+class StateGraph:
+
+    def __init__(
+        self,
+        webstates: list[webstate.WebState] | None = None,
+        journal: journal.Journal | None = None,
+    ):
+        self.webstates: list[webstate.WebState] = webstates or []
+        self.journal = journal
+        self._index = webstate.StateIndex(self.webstates)
+        self._lock = threading.RLock()
+        self._actions_changed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._states_by_id: dict[uuid.UUID, webstate.WebState] = {}
+        # Cheapest known transition to each neighbour of a state
+        self._adjacency: dict[uuid.UUID, dict[uuid.UUID, webstate.StateTransition]] = {}
+
+        for ws in self.webstates:
+            self._states_by_id[ws.ws_id] = ws
+            self._adjacency[ws.ws_id] = {}
+
+        for ws in self.webstates:
+            for transition in ws.transitions:
+                self._index_transition(ws, transition)
+
+        # Restored states may come from elsewhere than the journal, e.g. a JSON file
+        if self.journal and self.webstates:
+            self.journal.compact(self.webstates)
+
+    @property
+    def root(self) -> webstate.WebState | None:
+        return self.webstates[0] if self.webstates else None
+
+    def find_similar(self, embedding: list[float]) -> webstate.WebState | None:
+        with self._lock:
+            return self._index.find_similar(
+                embedding, config.TITLE_SIMILARITY_THRESHOLD
+            )
+
+    def add_state(self, ws: webstate.WebState) -> webstate.WebState:
+        with self._lock:
+            # Another worker may have added the same state while this one was described
+            ws_existing = self.find_similar(ws.title_embedding)
+            if ws_existing:
+                logging.info(f"State {ws.title} was added by another worker")
+                return ws_existing
+            self.webstates.append(ws)
+            self._index.add(ws)
+            self._states_by_id[ws.ws_id] = ws
+            self._adjacency[ws.ws_id] = {}
+            for transition in ws.transitions:
+                self._index_transition(ws, transition)
+            if self.journal:
+                self.journal.log_state(ws)
+
+        self._compact_journal()
+        return ws
+
+    def add_transition(
+        self, ws: webstate.WebState, transition: webstate.StateTransition
+    ) -> None:
+        with self._lock:
+            ws.transitions.append(transition)
+            self._index_transition(ws, transition)
+            if self.journal:
+                self.journal.log_transition(ws, transition)
+
+        self._compact_journal()
+
+    def add_url(self, ws: webstate.WebState, url: str) -> None:
+        with self._lock:
+            if url in ws.urls:
+                return
+            ws.urls.append(url)
+            if self.journal:
+                self.journal.log_url(ws, url)
+
+        self._compact_journal()
+
+    def update_action(
+        self,
+        ws: webstate.WebState,
+        action: webstate.Action,
+        status: webstate.ActionStatus,
+        function_calls: list,
+    ) -> None:
+        with self._lock:
+            action.status = status
+            action.function_calls = function_calls
+            if self.journal:
+                self.journal.log_action(ws, action)
+
+        self._compact_journal()
+
+    def claim_action(self, ws: webstate.WebState) -> webstate.Action | None:
+        with self._lock:
+            action = ws.choose_action(claim=True)
+            if action:
+                self._in_flight += 1
+            return action
+
+    def release_action(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._actions_changed.notify_all()
+
+    def wait_for_next_action(
+        self, ws_current: webstate.WebState | None
+    ) -> ActionPlan | None:
+        # Returns None only when no action is available and none is in flight
+        with self._lock:
+            while True:
+                plan = self.plan_next_action(ws_current)
+                if plan or self._in_flight == 0:
+                    return plan
+                logging.info(
+                    f"Waiting for {self._in_flight} actions in flight to find new states"
+                )
+                self._actions_changed.wait()
+
+    def plan_next_action(
+        self, ws_current: webstate.WebState | None
+    ) -> ActionPlan | None:
+        # Dijkstra search started both from the current state and, with an extra
+        # reset cost, from the start page. The first settled state with an
+        # available action is the cheapest one to reach.
+        with self._lock:
+            counter = itertools.count()
+            queue: list[tuple[float, int, uuid.UUID, bool]] = []
+            predecessors: dict[
+                uuid.UUID, tuple[uuid.UUID, webstate.StateTransition] | None
+            ] = {}
+            best_costs: dict[uuid.UUID, float] = {}
+            settled: set[uuid.UUID] = set()
+            sources = []
+
+            if ws_current and ws_current.ws_id in self._states_by_id:
+                sources.append((0.0, ws_current.ws_id, False))
+            if self.root:
+                sources.append((config.RESET_COST, self.root.ws_id, True))
+
+            for cost, ws_id, reset in sources:
+                if cost < best_costs.get(ws_id, float("inf")):
+                    best_costs[ws_id] = cost
+                    predecessors[ws_id] = None
+                    heapq.heappush(queue, (cost, next(counter), ws_id, reset))
+
+            while queue:
+                cost, _, ws_id, reset = heapq.heappop(queue)
+
+                if ws_id in settled:
+                    continue
+
+                settled.add(ws_id)
+                ws = self._states_by_id[ws_id]
+                action = self.claim_action(ws)
+
+                if action:
+                    transitions = []
+                    predecessor = predecessors[ws_id]
+                    while predecessor is not None:
+                        transitions.append(predecessor[1])
+                        predecessor = predecessors[predecessor[0]]
+                    transitions.reverse()
+                    logging.info(
+                        f"Found next available action: {action.description} in state: {ws.title}, "
+                        f"replay cost: {cost}, reset: {reset}"
+                    )
+                    return ActionPlan(action, transitions, reset, cost)
+
+                for ws_id_new, transition in self._adjacency[ws_id].items():
+                    cost_new = cost + transition_cost(transition)
+                    if ws_id_new in settled or cost_new >= best_costs.get(
+                        ws_id_new, float("inf")
+                    ):
+                        continue
+                    best_costs[ws_id_new] = cost_new
+                    predecessors[ws_id_new] = (ws_id, transition)
+                    heapq.heappush(queue, (cost_new, next(counter), ws_id_new, reset))
+
+        return None
+
+    def _compact_journal(self) -> None:
+        # Called without holding the lock, so other workers only wait until the
+        # snapshot is taken and not until it is written
+        if not self.journal or not self.journal.should_compact:
+            return
+        with self._lock:
+            if not self.journal.should_compact:
+                return
+            snapshot = self.journal.snapshot(self.webstates)
+        self.journal.write_snapshot(*snapshot)
+
+    def _index_transition(
+        self, ws: webstate.WebState, transition: webstate.StateTransition
+    ) -> None:
+        ws_id_new = transition.state_new.ws_id
+        transition_best = self._adjacency[ws.ws_id].get(ws_id_new)
+        if transition_best is None or transition_cost(transition) < transition_cost(
+            transition_best
+        ):
+            self._adjacency[ws.ws_id][ws_id_new] = transition
+
+
+def transition_cost(transition: webstate.StateTransition) -> int:
+    # Replaying a transition takes time proportional to the number of tool calls
+    return max(1, len(transition.action.function_calls))
@@ -1,12 +1,17 @@
+import collections.abc
+import dataclasses
 import logging
 import re
+import threading
 import typing
+import weakref
 
 import bs4
 import playwright.sync_api
 import htmlmin
 
 from . import config
+from . import profiler
 
 
 class PageNotLoadedException(Exception):
@@ -35,36 +40,367 @@ JS_FUNCTIONS = """
         });
     }
 
+    // DOM version is increased on every change of the page except for attributes
+    // set by the functions above, so unchanged pages can be served from a cache
+    let domVersion = 0;
+    const domDocumentId = Math.random().toString(36).slice(2);
+    const ownAttributes = ['data-current-value', 'data-playwright-invisible'];
+
+    function increaseDomVersion() {
+        domVersion++;
+        markPageActivity();
+    }
+
+    function getDomVersion() {
+        return domDocumentId + ':' + domVersion;
+    }
+
+    new MutationObserver(mutations => {
+        const foreign = mutations.some(
+            m => m.type !== 'attributes' || !ownAttributes.includes(m.attributeName)
+        );
+        if (foreign) {
+            increaseDomVersion();
+        }
+    }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+
+    // Values of form fields are not reflected in the DOM, so watch them separately
+    document.addEventListener('input', increaseDomVersion, true);
+    document.addEventListener('change', increaseDomVersion, true);
+    window.addEventListener('resize', increaseDomVersion);
+
+    // Page activity used to detect when the page settled after an action - requests
+    // sent by the page, DOM changes and running animations
+    let pendingRequests = 0;
+    let lastActivity = performance.now();
+    // Start times of pending requests by request id
+    const requestStarts = new Map();
+    let lastRequestId = 0;
+
+    function markPageActivity() {
+        lastActivity = performance.now();
+    }
+
+    function startRequest() {
+        pendingRequests++;
+        markPageActivity();
+        requestStarts.set(++lastRequestId, performance.now());
+        return lastRequestId;
+    }
+
+    function finishRequest(requestId) {
+        pendingRequests--;
+        requestStarts.delete(requestId);
+        markPageActivity();
+    }
+
+    const originalFetch = window.fetch;
+    window.fetch = function (...args) {
+        const requestId = startRequest();
+        try {
+            return originalFetch.apply(this, args).finally(() => finishRequest(requestId));
+        } catch (e) {
+            finishRequest(requestId);
+            throw e;
+        }
+    };
+
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function (...args) {
+        const requestId = startRequest();
+        const onLoadEnd = () => finishRequest(requestId);
+        this.addEventListener('loadend', onLoadEnd, {once: true});
+        try {
+            return originalSend.apply(this, args);
+        } catch (e) {
+            this.removeEventListener('loadend', onLoadEnd);
+            finishRequest(requestId);
+            throw e;
+        }
+    };
+
+    function hasRecentRequests(requestTimeout) {
+        // Requests pending for longer (long-polling, analytics beacons) do not keep the
+        // page from settling
+        const now = performance.now();
+        for (const start of requestStarts.values()) {
+            if (now - start < requestTimeout) {
+                return true;
+            }
+        }
+        return false;
+    }
+
+    function hasRunningAnimations() {
+        // Infinite animations (e.g. spinners) would never finish, they are left to the
+        // LLM loading check
+        return document.getAnimations().some(
+            a => a.playState === 'running' && a.effect
+                && isFinite(a.effect.getComputedTiming().endTime)
+        );
+    }
+
+    function isPageSettled(quietTime, requestTimeout) {
+        if (document.readyState !== 'complete' || hasRecentRequests(requestTimeout)) {
+            return false;
+        }
+        if (hasRunningAnimations()) {
+            markPageActivity();
+            return false;
+        }
+        return performance.now() - lastActivity >= quietTime;
+    }
+
+    // Signals used to decide if the page is loading without asking the LLM
+    const loadingSelector = [
+        '[aria-busy="true"]', '[role="progressbar"]', '[class*="spinner" i]',
+        '[class*="loader" i]', '[class*="loading" i]', '[class*="skeleton" i]',
+        '[class*="shimmer" i]'
+    ].join(',');
+    const layoutShifts = [];
+
+    if (PerformanceObserver.supportedEntryTypes.includes('layout-shift')) {
+        new PerformanceObserver(list => {
+            for (const entry of list.getEntries()) {
+                if (!entry.hadRecentInput) {
+                    layoutShifts.push([entry.startTime, entry.value]);
+                }
+            }
+        }).observe({type: 'layout-shift', buffered: true});
+    }
+
+    function getLoadingSignals(layoutShiftWindow) {
+        const now = performance.now();
+        const busyElements = Array.from(document.querySelectorAll(loadingSelector))
+            .filter(isVisible);
+        const layoutShift = layoutShifts
+            .filter(([time, value]) => now - time <= layoutShiftWindow)
+            .reduce((sum, [time, value]) => sum + value, 0);
+        return {
+            ready_state: document.readyState,
+            pending_requests: pendingRequests,
+            busy_elements: busyElements.length,
+            layout_shift: layoutShift,
+            text_length: document.body ? document.body.innerText.trim().length : 0
+        };
+    }
+
+    // In-browser equivalent of the BeautifulSoup cleaning pipeline in html.py
+    const uselessTags = ['path', 'meta', 'link', 'noscript', 'script', 'style'];
+    const allowedAttributes = [
+        'id', 'name', 'value', 'placeholder', 'data-test-id', 'data-testid',
+        'data-current-value', 'data-playwright-invisible', 'href', 'class'
+    ];
+    const voidTags = [
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+        'param', 'source', 'track', 'wbr'
+    ];
+    const whitespaceTags = ['pre', 'textarea'];
+
+    function escapeHtml(text) {
+        return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    }
+
+    function serializePruned(node, keepWhitespace, output) {
+        if (node.nodeType === Node.TEXT_NODE) {
+            const text = keepWhitespace ? node.data : node.data.replace(/\\s+/g, ' ');
+            output.push(escapeHtml(text));
+            return;
+        }
+
+        if (node.nodeType !== Node.ELEMENT_NODE) {
+            return;
+        }
+
+        const tag = node.tagName.toLowerCase();
+
+        if (uselessTags.includes(tag) || node.hasAttribute('data-playwright-invisible')) {
+            return;
+        }
+
+        output.push('<' + tag);
+        for (const attribute of node.attributes) {
+            if (allowedAttributes.includes(attribute.name)) {
+                output.push(' ' + attribute.name + '="' + escapeHtml(attribute.value).replace(/"/g, '&quot;') + '"');
+            }
+        }
+        output.push('>');
+
+        if (voidTags.includes(tag)) {
+            return;
+        }
+
+        const children = tag === 'template' ? node.content.childNodes : node.childNodes;
+        for (const child of children) {
+            serializePruned(child, keepWhitespace || whitespaceTags.includes(tag), output);
+        }
+        output.push('</' + tag + '>');
+    }
+
+    function getPrunedHtml() {
+        setValueAsDataAttribute();
+        markInvisibleElements();
+        const output = [];
+        if (document.doctype) {
+            output.push('<!DOCTYPE ' + document.doctype.name + '>');
+        }
+        serializePruned(document.documentElement, false, output);
+        return output.join('');
+    }
+
     window.setValueAsDataAttribute = setValueAsDataAttribute;
     window.markInvisibleElements = markInvisibleElements;
+    window.getDomVersion = getDomVersion;
+    window.getPrunedHtml = getPrunedHtml;
+    window.markPageActivity = markPageActivity;
+    window.isPageSettled = isPageSettled;
+    window.getLoadingSignals = getLoadingSignals;
 """
 
 
+# Rough approximation of a BPE tokenizer - short runs of word characters
+# and pairs of punctuation characters usually map to a single token
+TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]{1,2}")
+
+
+class HtmlChunks(collections.abc.Sequence):
+
+    def __init__(self, html: str, max_tokens: int = config.HTML_PART_TOKENS):
+        self._html = html
+        self._max_tokens = max_tokens
+        self._segments = _iterate_segments(html)
+        self._part_tokens = 0
+        # Empty HTML is a single empty part, like a page without any tags
+        self._complete = False
+        # Start offsets of parts, the last item is the end of the last complete part
+        self._bounds = [0]
+
+    def __len__(self) -> int:
+        self._scan()
+        return len(self._bounds) - 1
+
+    @typing.overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @typing.overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+
+    def __getitem__(self, index: int | slice) -> str | list[str]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        self._scan(index + 1)
+
+        if index < 0 or index >= len(self._bounds) - 1:
+            raise IndexError(f"HTML part {index} out of range")
+
+        return self._html[self._bounds[index] : self._bounds[index + 1]]
+
+    def _scan(self, parts: int | None = None) -> None:
+        # Splits the HTML only as far as needed to know the requested number of parts
+        while not self._complete and (parts is None or len(self._bounds) <= parts):
+            segment = next(self._segments, None)
+
+            if segment is None:
+                self._bounds.append(len(self._html))
+                self._complete = True
+                break
+
+            start, tokens = segment
+
+            if (
+                self._part_tokens + tokens > self._max_tokens
+                and start > self._bounds[-1]
+            ):
+                self._bounds.append(start)
+                self._part_tokens = 0
+
+            self._part_tokens += tokens
+
+
+@dataclasses.dataclass
+class HtmlSnapshot:
+    url: str
+    dom_version: str
+    htmls: dict[bool, str] = dataclasses.field(default_factory=dict)
+    chunks: dict[bool, HtmlChunks] = dataclasses.field(default_factory=dict)
+
+
+# Cleaned HTML of the last seen DOM version of each page
+_snapshots: "weakref.WeakKeyDictionary[playwright.sync_api.Page, HtmlSnapshot]" = (
+    weakref.WeakKeyDictionary()
+)
+_snapshots_lock = threading.Lock()
+
+
 def iterate_html(
     page: playwright.sync_api.Page, minified: bool = True
 ) -> typing.Iterable[str]:
-    html = get_full_html(page, minified=minified)
-    html_tokens = html.split("<")
+    yield from get_html_chunks(page, minified)
 
-    i = 0
 
-    while i < len(html_tokens):
-        part = ""
-        while (
-            i < len(html_tokens)
-            and len(part) + len(html_tokens[i]) < config.HTML_PART_LENGTH
-        ):
-            part += ("<" if i > 0 else "") + html_tokens[i]
-            i += 1
-        yield part
+def get_html_chunks(
+    page: playwright.sync_api.Page, minified: bool = True
+) -> HtmlChunks:
+    snapshot = _get_snapshot(page, minified)
+
+    if minified not in snapshot.chunks:
+        snapshot.chunks[minified] = HtmlChunks(snapshot.htmls[minified])
+
+    return snapshot.chunks[minified]
 
 
 def get_full_html(page: playwright.sync_api.Page, minified: bool = True) -> str:
-    page.evaluate("setValueAsDataAttribute()")
-    page.evaluate("markInvisibleElements()")
+    return _get_snapshot(page, minified).htmls[minified]
+
+
+def _iterate_segments(html: str) -> typing.Iterator[tuple[int, int]]:
+    # Segments start at each "<" so parts are always split on tag boundaries
+    start = 0
+    while start < len(html):
+        end = html.find("<", start + 1)
+        if end == -1:
+            end = len(html)
+        yield start, len(TOKEN_PATTERN.findall(html, start, end))
+        start = end
 
+
+def _get_snapshot(page: playwright.sync_api.Page, minified: bool) -> HtmlSnapshot:
     if page.url == "about:blank":
         raise PageNotLoadedException("No page loaded yet")
+
+    dom_version = page.evaluate("getDomVersion()")
+
+    with _snapshots_lock:
+        snapshot = _snapshots.get(page)
+        if (
+            snapshot is None
+            or snapshot.url != page.url
+            or snapshot.dom_version != dom_version
+        ):
+            snapshot = HtmlSnapshot(page.url, dom_version)
+            _snapshots[page] = snapshot
+
+    if minified not in snapshot.htmls:
+        with profiler.span("clean_html", engine=config.HTML_CLEANING_ENGINE):
+            snapshot.htmls[minified] = _clean_html(page, minified)
+    else:
+        logging.debug(f"Using cached HTML of DOM version {dom_version}")
+
+    return snapshot
+
+
+def _clean_html(page: playwright.sync_api.Page, minified: bool) -> str:
+    # The browser engine only produces minified HTML
+    if minified and config.HTML_CLEANING_ENGINE == "browser":
+        return page.evaluate("getPrunedHtml()")
+
+    page.evaluate("setValueAsDataAttribute()")
+    page.evaluate("markInvisibleElements()")
+
     html = page.content()
     soup = bs4.BeautifulSoup(html, "html.parser")
     _remove_invisible(soup)
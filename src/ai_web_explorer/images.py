@@ -0,0 +1,183 @@
+import base64
+import collections
+import dataclasses
+import hashlib
+import io
+import logging
+import threading
+import typing
+
+from . import config
+
+FORMATS = ("png", "jpeg", "webp")
+DETAILS = ("auto", "low", "high")
+
+
+# How screenshots are sent with a prompt, set by the image section of the prompt
+# in prompts.yaml. The default sends the original PNG screenshots.
+@dataclasses.dataclass(frozen=True)
+class ImagePolicy:
+    # Longest side of the image in pixels, larger images are downscaled
+    max_size: int | None = None
+    format: str = "png"
+    # Quality of JPEG and WebP images
+    quality: int = config.IMAGE_QUALITY_DEFAULT
+    # Detail level of the OpenAI API, None leaves the default of the API
+    detail: str | None = None
+    # Crop a pair of screenshots (before and after an action) to the region
+    # that changed between them
+    crop_changes: bool = False
+
+    def __post_init__(self):
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown image format {self.format}")
+        if self.detail is not None and self.detail not in DETAILS:
+            raise ValueError(f"Unknown image detail {self.detail}")
+        if self.max_size is not None and self.max_size < 1:
+            raise ValueError("Image max_size must be positive")
+        if not 1 <= self.quality <= 100:
+            raise ValueError("Image quality must be between 1 and 100")
+
+    @property
+    def transforms(self) -> bool:
+        return self.max_size is not None or self.format != "png" or self.crop_changes
+
+    @classmethod
+    def from_dict(cls, policy_raw: dict) -> "ImagePolicy":
+        unknown = set(policy_raw) - {f.name for f in dataclasses.fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown image settings {', '.join(sorted(unknown))}")
+        return cls(**policy_raw)
+
+
+# Screenshots encoded into data URLs according to image policies. The same
+# screenshot is often sent with several prompts in one iteration (e.g. every part
+# of the description), so encoded images are kept in an LRU cache keyed by the
+# hash of the original image and the policy.
+class ImageEncoder:
+
+    def __init__(self, cache_size: int = config.IMAGE_CACHE_SIZE):
+        self._cache_size = cache_size
+        self._cache: collections.OrderedDict[tuple, typing.Any] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._pillow_missing_logged = False
+
+    def encode(self, images: list[bytes], policy: ImagePolicy) -> list[str]:
+        hashes = [hashlib.sha256(image).digest() for image in images]
+        crop = None
+
+        if policy.crop_changes and len(images) == 2 and self._pillow() is not None:
+            key = ("crop", hashes[0], hashes[1])
+            crop = self._cached(key, lambda: _changed_region(images[0], images[1]))
+
+        return [
+            self._cached(
+                (image_hash, policy, crop),
+                lambda: self._encode(image, policy, crop),
+            )
+            for image, image_hash in zip(images, hashes)
+        ]
+
+    def _cached(self, key: tuple, compute: typing.Callable) -> typing.Any:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        value = compute()
+
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return value
+
+    def _encode(
+        self, image: bytes, policy: ImagePolicy, crop: tuple[int, ...] | None
+    ) -> str:
+        media_type = "png"
+
+        if policy.transforms and self._pillow() is not None:
+            image, media_type = _transform(image, policy, crop)
+
+        image_encoded = base64.b64encode(image).decode("utf-8")
+        return f"data:image/{media_type};base64,{image_encoded}"
+
+    def _pillow(self) -> typing.Any:
+        # Optional dependency only needed for transformed images
+        try:
+            import PIL.Image
+
+            return PIL.Image
+        except ImportError:
+            if not self._pillow_missing_logged:
+                logging.warning(
+                    "Pillow is not installed, screenshots are sent unchanged"
+                )
+                self._pillow_missing_logged = True
+            return None
+
+
+def _changed_region(before: bytes, after: bytes) -> tuple[int, ...] | None:
+    from PIL import Image, ImageChops
+
+    image_before = Image.open(io.BytesIO(before)).convert("RGB")
+    image_after = Image.open(io.BytesIO(after)).convert("RGB")
+
+    if image_before.size != image_after.size:
+        return None
+
+    box = ImageChops.difference(image_before, image_after).getbbox()
+
+    if box is None:
+        return None
+
+    # Some surroundings of the change help to tell what changed
+    margin = config.IMAGE_CROP_MARGIN
+    width, height = image_before.size
+    return (
+        max(0, box[0] - margin),
+        max(0, box[1] - margin),
+        min(width, box[2] + margin),
+        min(height, box[3] + margin),
+    )
+
+
+def _transform(
+    image_bytes: bytes, policy: ImagePolicy, crop: tuple[int, ...] | None
+) -> tuple[bytes, str]:
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+
+    if crop is not None:
+        image = image.crop(crop)
+
+    if policy.max_size is not None and max(image.size) > policy.max_size:
+        image.thumbnail((policy.max_size, policy.max_size), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+
+    if policy.format == "jpeg":
+        image.convert("RGB").save(output, "JPEG", quality=policy.quality)
+    elif policy.format == "webp":
+        image.save(output, "WEBP", quality=policy.quality)
+    else:
+        image.save(output, "PNG", optimize=True)
+
+    return output.getvalue(), policy.format
+
+
+_encoder: ImageEncoder | None = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder() -> ImageEncoder:
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = ImageEncoder()
+        return _encoder
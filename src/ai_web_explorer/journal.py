@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+import uuid
+
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from . import config
+from . import webstate
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.jsonl"
+
+
+# Changes of the state graph appended to a JSONL file as they happen, so an
+# interrupted exploration can be resumed. The journal is periodically compacted
+# into a snapshot of the whole graph. Every record has a sequence number and the
+# snapshot stores the last one it contains, so records written before a crash
+# during compaction are not applied twice.
+#
+# A compaction takes time proportional to the size of the graph, so the number of
+# records between compactions grows with the number of records written so far and
+# the total time spent compacting stays linear. Only taking the snapshot needs the
+# graph to be unchanged, it is serialized and written by write_snapshot while
+# the exploration continues.
+class Journal:
+
+    def __init__(self, path: str, compact_every: int = config.JOURNAL_COMPACT_EVERY):
+        self.path = path
+        self._compact_every = compact_every
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._snapshot_sequence = 0
+        self._sequence = self._recover()
+        self._records_since_snapshot = 0
+        self._compact_after = max(compact_every, self._sequence)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.path, SNAPSHOT_FILE)
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.path, JOURNAL_FILE)
+
+    @property
+    def should_compact(self) -> bool:
+        return self._records_since_snapshot >= self._compact_after
+
+    def log_state(self, ws: webstate.WebState) -> None:
+        self._append({"type": "state", "state": ws.dict()})
+
+    def log_url(self, ws: webstate.WebState, url: str) -> None:
+        self._append({"type": "url", "ws_id": str(ws.ws_id), "url": url})
+
+    def log_action(self, ws: webstate.WebState, action: webstate.Action) -> None:
+        self._append(
+            {
+                "type": "action",
+                "ws_id": str(ws.ws_id),
+                "action": _action_index(ws, action),
+                "status": action.status,
+                "function_calls": [f.model_dump() for f in action.function_calls],
+            }
+        )
+
+    def log_transition(
+        self, ws: webstate.WebState, transition: webstate.StateTransition
+    ) -> None:
+        self._append(
+            {
+                "type": "transition",
+                "ws_id": str(ws.ws_id),
+                "transition": transition.dict(),
+            }
+        )
+
+    def compact(self, webstates: list[webstate.WebState]) -> None:
+        self.write_snapshot(*self.snapshot(webstates))
+
+    def snapshot(self, webstates: list[webstate.WebState]) -> tuple[int, list[dict]]:
+        # The states must not change until the snapshot is taken
+        with self._lock:
+            self._records_since_snapshot = 0
+            self._compact_after = max(self._compact_every, self._sequence)
+            return self._sequence, [ws.dict() for ws in webstates]
+
+    def write_snapshot(self, sequence: int, webstates_raw: list[dict]) -> None:
+        with self._snapshot_lock:
+            # A newer snapshot may have been written in the meantime
+            if sequence <= self._snapshot_sequence:
+                return
+
+            logging.info(f"Compacting journal {self.path}")
+            snapshot_tmp_path = f"{self.snapshot_path}.tmp"
+
+            with open(snapshot_tmp_path, "w") as f:
+                json.dump({"sequence": sequence, "webstates": webstates_raw}, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(snapshot_tmp_path, self.snapshot_path)
+            self._snapshot_sequence = sequence
+
+            with self._lock:
+                # Records up to the sequence are in the snapshot now, records
+                # appended while it was written are kept
+                self._drop_records(sequence)
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._sequence += 1
+            record["sequence"] = self._sequence
+
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+            self._records_since_snapshot += 1
+
+    def _drop_records(self, sequence: int) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+
+        journal_tmp_path = f"{self.journal_path}.tmp"
+
+        with open(self.journal_path) as f_in, open(journal_tmp_path, "w") as f_out:
+            for line in f_in:
+                if json.loads(line)["sequence"] > sequence:
+                    f_out.write(line)
+
+        os.replace(journal_tmp_path, self.journal_path)
+
+    def _recover(self) -> int:
+        # Returns the last sequence number and drops a record only partially
+        # written before a crash, so new records start on a new line
+        sequence = self._snapshot_sequence = _read_snapshot(self.snapshot_path)[0]
+
+        if not os.path.exists(self.journal_path):
+            return sequence
+
+        valid_size = 0
+
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                sequence = max(sequence, record["sequence"])
+                valid_size += len(line)
+
+        if valid_size != os.path.getsize(self.journal_path):
+            logging.warning(f"Dropping incomplete record at the end of the journal")
+            os.truncate(self.journal_path, valid_size)
+
+        return sequence
+
+
+def load_journal(path: str) -> list[webstate.WebState]:
+    with webstate.gc_paused():
+        return _load_journal(path)
+
+
+def _load_journal(path: str) -> list[webstate.WebState]:
+    sequence, webstates_raw = _read_snapshot(os.path.join(path, SNAPSHOT_FILE))
+    webstates = [webstate.WebState.from_dict(ws_raw) for ws_raw in webstates_raw]
+    webstates_by_id = {ws.ws_id: ws for ws in webstates}
+    transitions_raw = [
+        (ws.ws_id, t)
+        for ws, ws_raw in zip(webstates, webstates_raw)
+        for t in ws_raw["transitions"]
+        if t
+    ]
+    journal_path = os.path.join(path, JOURNAL_FILE)
+    records_count = 0
+
+    if os.path.exists(journal_path):
+        with open(journal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(
+                        "Ignoring incomplete record at the end of the journal"
+                    )
+                    break
+
+                if record["sequence"] <= sequence:
+                    continue
+
+                records_count += 1
+
+                if record["type"] == "state":
+                    ws = webstate.WebState.from_dict(record["state"])
+                    webstates.append(ws)
+                    webstates_by_id[ws.ws_id] = ws
+                elif record["type"] == "url":
+                    webstates_by_id[uuid.UUID(record["ws_id"])].urls.append(
+                        record["url"]
+                    )
+                elif record["type"] == "action":
+                    ws = webstates_by_id[uuid.UUID(record["ws_id"])]
+                    action = ws.actions[record["action"]]
+                    action.status = record["status"]
+                    action.function_calls = [
+                        ChatCompletionMessageToolCall(**f)
+                        for f in record["function_calls"]
+                    ]
+                elif record["type"] == "transition":
+                    transitions_raw.append(
+                        (uuid.UUID(record["ws_id"]), record["transition"])
+                    )
+
+    webstate.link_transitions(webstates_by_id, transitions_raw)
+
+    logging.info(
+        f"Loaded {len(webstates)} states from journal {path}, "
+        f"{records_count} records replayed after the snapshot"
+    )
+    return webstates
+
+
+def _read_snapshot(snapshot_path: str) -> tuple[int, list[dict]]:
+    if not os.path.exists(snapshot_path):
+        return 0, []
+
+    with open(snapshot_path) as f:
+        snapshot = json.load(f)
+
+    return snapshot["sequence"], snapshot["webstates"]
+
+
+def _action_index(ws: webstate.WebState, action: webstate.Action) -> int:
+    for i, a in enumerate(ws.actions):
+        if a is action:
+            return i
+    raise ValueError(f"Action {action.description} is not in state {ws.title}")
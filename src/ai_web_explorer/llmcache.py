@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+import openai
+import pydantic
+from openai.types import chat
+
+from . import config
+from . import metrics
+from . import profiler
+
+CacheMode = typing.Literal["disabled", "read", "readwrite"]
+CACHE_MODES: tuple[CacheMode, ...] = typing.get_args(CacheMode)
+
+
+# Chat completions stored on disk, one JSON file per request. The key is a hash
+# of the whole request including base64 encoded screenshots, so only identical
+# requests are answered from the cache.
+class ResponseCache:
+
+    def __init__(
+        self,
+        path: str,
+        mode: CacheMode = "readwrite",
+        max_size: int = config.LLM_CACHE_MAX_SIZE,
+        max_age: float = config.LLM_CACHE_MAX_AGE,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode}")
+
+        self.path = path
+        self.mode = mode
+        self._max_size = max_size
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._size = 0
+
+        if self.mode != "disabled":
+            os.makedirs(self.path, exist_ok=True)
+            self.evict()
+
+    def key(self, client: openai.Client, request: dict) -> str:
+        payload = {"base_url": str(client.base_url), "request": request}
+        payload_str = json.dumps(payload, sort_keys=True, default=_serialize)
+        return hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> chat.ChatCompletion | None:
+        if self.mode == "disabled":
+            return None
+
+        entry_path = self._entry_path(key)
+
+        try:
+            if time.time() - os.path.getmtime(entry_path) > self._max_age:
+                self._remove(entry_path)
+                return None
+            with open(entry_path) as f:
+                return chat.ChatCompletion.model_validate(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, pydantic.ValidationError) as e:
+            logging.warning(f"Ignoring corrupted LLM cache entry {entry_path}: {e}")
+            self._remove(entry_path)
+            return None
+
+    def put(self, key: str, completion: chat.ChatCompletion) -> None:
+        if self.mode != "readwrite":
+            return
+
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        entry_tmp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+
+        with open(entry_tmp_path, "w") as f:
+            f.write(completion.model_dump_json())
+
+        os.replace(entry_tmp_path, entry_path)
+
+        with self._lock:
+            self._size += os.path.getsize(entry_path)
+            evict = self._size > self._max_size
+
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        with self._lock:
+            now = time.time()
+            entries = []
+
+            for directory, _, files in os.walk(self.path):
+                for file in files:
+                    entry_path = os.path.join(directory, file)
+                    try:
+                        stat = os.stat(entry_path)
+                    except FileNotFoundError:
+                        continue
+                    if now - stat.st_mtime > self._max_age:
+                        self._remove(entry_path)
+                    else:
+                        entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+            self._size = sum(size for _, size, _ in entries)
+            entries.sort()
+
+            while entries and self._size > self._max_size:
+                _, size, entry_path = entries.pop(0)
+                self._remove(entry_path)
+                self._size -= size
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def _remove(self, entry_path: str) -> None:
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+
+
+_cache: ResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.mode != config.LLM_CACHE_MODE:
+            _cache = ResponseCache(config.LLM_CACHE_PATH, config.LLM_CACHE_MODE)
+        return _cache
+
+
+def create_completion(
+    client: openai.Client, prompt_name: str = "unknown", **request
+) -> chat.ChatCompletion:
+    response_cache = get_cache()
+    key = None
+
+    if response_cache.mode != "disabled":
+        key = response_cache.key(client, request)
+        completion = response_cache.get(key)
+
+        if completion is not None:
+            logging.info(f"Using cached LLM response {key[:12]}")
+            metrics.get_registry().record_call(
+                prompt_name, request["model"], 0.0, completion.usage, cached=True
+            )
+            return completion
+
+    start = time.perf_counter()
+
+    try:
+        with profiler.span("llm", prompt=prompt_name):
+            completion = client.chat.completions.create(**request)
+    except openai.OpenAIError:
+        metrics.get_registry().record_error(prompt_name)
+        raise
+
+    metrics.get_registry().record_call(
+        prompt_name, request["model"], time.perf_counter() - start, completion.usage
+    )
+
+    if key is not None:
+        response_cache.put(key, completion)
+    return completion
+
+
+def _serialize(value: typing.Any) -> typing.Any:
+    if isinstance(value, openai.NotGiven):
+        return None
+    if isinstance(value, pydantic.BaseModel):
+        # Responses replayed from the cache have all fields set, so only fields
+        # with a value make a response sent back in a conversation the same
+        return value.model_dump(exclude_none=True)
+    raise TypeError(f"Cannot serialize {type(value)} for LLM cache key")
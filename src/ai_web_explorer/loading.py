@@ -0,0 +1,51 @@
+import dataclasses
+import logging
+
+import playwright.sync_api
+
+from . import config
+
+
+@dataclasses.dataclass
+class LoadingSignals:
+    ready_state: str
+    pending_requests: int
+    # Visible spinners, progress bars, skeletons and elements with aria-busy
+    busy_elements: int
+    layout_shift: float
+    text_length: int
+
+
+def get_loading_signals(page: playwright.sync_api.Page) -> LoadingSignals | None:
+    try:
+        signals = page.evaluate(
+            "shiftWindow => window.getLoadingSignals && window.getLoadingSignals(shiftWindow)",
+            config.LOADING_LAYOUT_SHIFT_WINDOW * 1000,
+        )
+    except playwright.sync_api.Error as e:
+        logging.warning(f"Error when getting loading signals: {e}")
+        return None
+
+    return LoadingSignals(**signals) if signals else None
+
+
+# Returns None if the signals are ambiguous and the LLM needs to look at the page
+def classify_loading(signals: LoadingSignals) -> bool | None:
+    if signals.ready_state != "complete":
+        return True
+
+    has_content = signals.text_length >= config.LOADING_MIN_TEXT_LENGTH
+
+    if signals.busy_elements > 0:
+        # A spinner on an otherwise empty page, but a page with content may only
+        # load a part of it or have a decorative loader
+        return True if not has_content else None
+
+    if (
+        signals.pending_requests > 0
+        or signals.layout_shift > config.LOADING_LAYOUT_SHIFT_THRESHOLD
+        or not has_content
+    ):
+        return None
+
+    return False
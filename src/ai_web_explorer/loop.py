@@ -1,7 +1,7 @@
 import dataclasses
 import json
 import logging
-import time
+import threading
 from urllib.parse import urlparse
 
 import openai
@@ -12,7 +12,12 @@ from . import describer
 from . import executor
 from . import config
 from . import cookies
+from . import embeddings
+from . import graph
 from . import html
+from . import journal
+from . import profiler
+from . import settle
 from . import config
 
 
@@ -24,11 +29,24 @@ class LoopConfig:
     username: str | None = dataclasses.field(default=None)
     password: str | None = dataclasses.field(default=None)
     additional_info: str | None = dataclasses.field(default=None)
+    # Directory of the exploration journal, None disables the journal
+    journal_path: str | None = dataclasses.field(default=None)
 
 
-WebStateBacktrack = tuple[
-    webstate.WebState, int | None, webstate.StateTransition | None
-]
+# Iterations shared by all workers exploring the same website
+class IterationCounter:
+
+    def __init__(self, limit: int | None):
+        self._limit = limit
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int | None:
+        with self._lock:
+            if self._limit is not None and self._count >= self._limit:
+                return None
+            self._count += 1
+            return self._count - 1
 
 
 class ExploreLoop:
@@ -39,79 +57,102 @@ class ExploreLoop:
         url: str,
         openai_client: openai.OpenAI,
         config: LoopConfig,
+        state_graph: graph.StateGraph | None = None,
+        iterations: IterationCounter | None = None,
     ):
         self._domain = domain
         self._url = url
         self._openai_client = openai_client
         self._config = config
 
-        self._webstates: list[webstate.WebState] = []
+        self._graph = state_graph or create_graph(config)
+        self._iterations = iterations
         self._webstate_current: webstate.WebState | None = None
         self._action_current: webstate.Action | None = None
-        self._pw, self._page = self._init_browser(self._url)
-        self._describer = describer.Describer(
-            self._page, openai_client, config.additional_info
-        )
-        self._executor = executor.Executor(
-            self._page,
-            openai_client,
-            config.username,
-            config.password,
-            config.additional_info,
-        )
+        # Whether the current action is claimed in the graph until its result is known
+        self._action_in_flight = False
+        # Cookies and local storage of the start page with accepted cookie consent,
+        # restored in every new browser context
+        self._storage_state: playwright.sync_api.StorageState | None = None
+        self._settle_stats = settle.SettleStats()
+        self._pw, self._browser = self._init_browser()
+        self._open_page(self._url)
 
     def start(self):
-        i = 0
-
-        while self._config.iterations is None or i < self._config.iterations:
-            logging.info(f"Iteration {i}")
-            self._explore()
-            i += 1
+        iterations = self._iterations or IterationCounter(self._config.iterations)
+
+        try:
+            while (i := iterations.next()) is not None:
+                logging.info(f"Iteration {i}")
+                with profiler.span("iteration", iteration=i):
+                    explored = self._explore()
+                logging.info(
+                    f"Waited {self._settle_stats.waited:.1f} s for the page to settle, "
+                    f"saved {self._settle_stats.saved:.1f} s compared to fixed sleeps"
+                )
+                self._settle_stats.reset()
+                if not explored:
+                    return
 
-        self._explore(True)
+            self._explore(True)
+        finally:
+            # Other workers must not wait for an action of a failed worker
+            self._release_action()
 
     def set_webstates(self, webstates: list[webstate.WebState]):
-        self._webstates = webstates
+        self._graph = restore_graph(self._openai_client, webstates, self._graph.journal)
 
-    def _explore(self, finish=False):
+    def _explore(self, finish=False) -> bool:
         logging.info(f"Current URL: {self._page.url}")
-        ws = self._get_webstate()
+        with profiler.span("get_webstate"):
+            ws = self._get_webstate()
+        profiler.tag(state=ws.title)
 
         if (
             self._webstate_current
             and self._action_current
             and self._action_current.status == "success"
         ):
-            self._webstate_current.transitions.append(
-                webstate.StateTransition(action=self._action_current, state_new=ws)
+            self._graph.add_transition(
+                self._webstate_current,
+                webstate.StateTransition(action=self._action_current, state_new=ws),
             )
 
+        self._release_action()
+
         if finish:
-            return
+            return False
 
         self._webstate_current = ws
-        self._action_current = ws.random_action
+        self._action_current = self._graph.claim_action(ws)
+        self._action_in_flight = self._action_current is not None
 
         if not self._action_current:
             logging.info("No more actions to take on this page")
             self._action_current = self._search_next_available_action()
             if not self._action_current:
                 logging.info("No more actions to take in the domain")
-                return
+                return False
 
         logging.info(f"Randomly selected action: {self._action_current.description}")
-        action_result, tool_calls = self._executor.execute(self._action_current)
-        self._action_current.function_calls = tool_calls
+        profiler.tag(action=self._action_current.description)
+        with profiler.span("execute_action"):
+            action_result, tool_calls = self._executor.execute(self._action_current)
 
         url_parsed = urlparse(self._page.url)
 
         if self._domain not in url_parsed.netloc:
             self._back_to_domain()
-            self._action_current.status = "failure"
-        else:
-            self._action_current.status = "success" if action_result else "failure"
+            action_result = False
 
+        self._graph.update_action(
+            self._webstate_current,
+            self._action_current,
+            "success" if action_result else "failure",
+            tool_calls,
+        )
         logging.info(f"Action result: {self._action_current.status}")
+        return True
 
     def _get_webstate(self) -> webstate.WebState:
         self._ensure_page_loaded()
@@ -120,13 +161,13 @@ class ExploreLoop:
         )
         embedding = self._describer.get_title_embedding(page_title)
 
-        for ws in self._webstates:
-            distance = ws.cosine_distance(embedding)
-            if distance > config.TITLE_SIMILARITY_THRESHOLD:
-                logging.info(f"Found similar state: {ws.title}")
-                if self._url not in ws.urls:
-                    ws.urls.append(self._url)
-                return ws
+        with profiler.span("find_similar"):
+            ws = self._graph.find_similar(embedding)
+
+        if ws:
+            logging.info(f"Found similar state: {ws.title}")
+            self._graph.add_url(ws, self._url)
+            return ws
 
         logging.info(f"Creating new state: {page_title}")
         ws = webstate.WebState(
@@ -139,56 +180,84 @@ class ExploreLoop:
         )
 
         ws.actions = self._describer.get_actions(ws.title, ws.description)
-        self._webstates.append(ws)
-        return ws
+        return self._graph.add_state(ws)
 
     def print_graph(self):
-        print("digraph G {")
-
-        for ws in self._webstates:
-            ws_id = str(ws.ws_id).replace("-", "")
-            print(f'ws_{ws_id} [label="{ws.title}"]')
-
-        for ws in self._webstates:
-            ws_id = str(ws.ws_id).replace("-", "")
-            for transition in ws.transitions:
-                ws_new = transition.state_new
-                ws_new_id = str(ws_new.ws_id).replace("-", "")
-                print(
-                    f'ws_{ws_id} -> ws_{ws_new_id} [label="{transition.action.description}"]'
-                )
+        print_graph(self._graph.webstates)
 
-        print("}")
-
-    def print_json(self, simple=True):
-        outputs = [ws.dict(simple) for ws in self._webstates]
-        print(json.dumps(outputs, indent=4))
+    def print_json(self, simple=True, embeddings_path: str | None = None):
+        print_json(self._graph.webstates, simple, embeddings_path)
 
     def stop(self):
         self._pw.stop()
 
     def _init_browser(
-        self, url: str
-    ) -> tuple[playwright.sync_api.Playwright, playwright.sync_api.Page]:
+        self,
+    ) -> tuple[playwright.sync_api.Playwright, playwright.sync_api.Browser]:
         pw = playwright.sync_api.sync_playwright().start()
-        browser = pw.chromium.launch(headless=False)
-        context = browser.new_context()
-        page = context.new_page()
-        page.add_init_script(html.JS_FUNCTIONS)
-        page.set_viewport_size(
+        browser = pw.chromium.launch(headless=config.BROWSER_HEADLESS)
+        return pw, browser
+
+    def _open_page(self, url: str):
+        context = self._browser.new_context(storage_state=self._storage_state)
+        context.add_init_script(html.JS_FUNCTIONS)
+        self._page = context.new_page()
+        self._page.set_viewport_size(
             {"width": config.BROWSER_SIZE[0], "height": config.BROWSER_SIZE[1]}
         )
-        page.goto(url, wait_until="domcontentloaded")
-        time.sleep(5)
-        cookies.accept_cookies_if_present(self._openai_client, page)
-        return pw, page
+        self._settler = settle.Settler(self._page, self._settle_stats)
+
+        if self._storage_state is None:
+            self._page.goto(url, wait_until="domcontentloaded")
+            self._settler.settle(replaced=config.PAGE_LOAD_SLEEP_TIME)
+            if cookies.accept_cookies_if_present(self._openai_client, self._page):
+                # Consent banners often store the consent asynchronously after the
+                # click, it must be part of the storage state reused by resets
+                self._settler.settle(replaced=config.ACTION_SLEEP_TIME, fresh=True)
+            self._storage_state = context.storage_state()
+        else:
+            self._page.goto(url, wait_until="load")
+
+        self._describer = describer.Describer(
+            self._page, self._openai_client, self._config.additional_info
+        )
+        self._executor = executor.Executor(
+            self._page,
+            self._openai_client,
+            self._config.username,
+            self._config.password,
+            self._config.additional_info,
+            self._settler,
+        )
+
+    def _reset_page(self):
+        # A fresh context in the running browser is much cheaper than relaunching
+        # the browser and the saved storage state makes cookie consent unnecessary
+        logging.info("Resetting the browser to the start page")
+        context = self._page.context
+
+        if config.RESET_KEEP_SESSION:
+            self._storage_state = context.storage_state()
 
+        context.close()
+        self._open_page(self._url)
+
+    @profiler.traced("ensure_loaded")
     def _ensure_page_loaded(self):
+        # Only repeated LLM checks are retries, not checks answered by page signals
+        checked_by_llm = False
+
         for _ in range(config.ENSURE_LOADED_MAX_TRIES):
-            if not self._describer.is_loading():
+            if not self._describer.is_loading(retry=checked_by_llm):
                 break
+            checked_by_llm = checked_by_llm or self._describer.loading_checked_by_llm
             logging.info("Page is still loading, waiting...")
-            time.sleep(config.ENSURE_LOADED_SLEEP_TIME)
+            self._settler.settle(replaced=config.ENSURE_LOADED_SLEEP_TIME, fresh=True)
+
+    def _release_action(self):
+        if self._action_in_flight:
+            self._graph.release_action()
+            self._action_in_flight = False
 
     def _back_to_domain(self):
         logging.info("Navigated away from domain, going back to domain")
@@ -201,52 +270,156 @@ class ExploreLoop:
         self._page.goto(f"https://{self._domain}")
 
     def _search_next_available_action(self) -> webstate.Action | None:
-        states_visiting: list[WebStateBacktrack] = [(self._webstates[0], None, None)]
-        states_visited = []
-
-        while len(states_visiting) > 0:
-            ws = states_visiting.pop()
-            states_visited.append(ws)
-
-            for action in ws[0].actions:
-                if action.status == "none":
-                    logging.info(
-                        f"Found next available action: {action.description} in state: {ws[0].title}"
-                    )
-                    transitions = []
-                    back: WebStateBacktrack = ws
-                    while type(back[1]) == int:
-                        transitions.append(back[2])
-                        back = states_visited[back[1]]  # type: ignore
-                    transitions.reverse()
-                    logging.info(f"Transitions to get to state: {ws[0].title}")
-                    for transition in transitions:
-                        logging.info(f"{transition.action.description}")
-                    self._perform_transitions(transitions)
-                    return action
-
-            for transition in ws[0].transitions:
-                if transition.state_new not in [state[0] for state in states_visited]:
-                    states_visiting.append(
-                        (transition.state_new, len(states_visited) - 1, transition)
-                    )
-
-        return None
-
-    def _perform_transitions(self, transitions: list[webstate.StateTransition]):
-        self.stop()
-        self._pw, self._page = self._init_browser(self._url)
-        self._executor = executor.Executor(
-            self._page,
-            self._openai_client,
-            self._config.username,
-            self._config.password,
-            self._config.additional_info,
-        )
-        self._describer = describer.Describer(
-            self._page, self._openai_client, self._config.additional_info
-        )
-        self._page.goto(self._url)
+        with profiler.span("plan"):
+            plan = self._graph.wait_for_next_action(self._webstate_current)
+
+        if not plan:
+            return None
+
+        self._action_in_flight = True
+        logging.info(f"Transitions to get to the state of the action:")
+        for transition in plan.transitions:
+            logging.info(f"{transition.action.description}")
+        with profiler.span("navigate", transitions=len(plan.transitions)):
+            self._perform_transitions(plan.transitions, plan.reset)
+        return plan.action
+
+    def _perform_transitions(
+        self, transitions: list[webstate.StateTransition], reset: bool = True
+    ):
+        if reset:
+            with profiler.span("reset"):
+                self._reset_page()
+            self._webstate_current = self._graph.root
         for transition in transitions:
             self._executor.replicate_tool_calls(transition.action.function_calls)
             self._webstate_current = transition.state_new
+
+
+# Explores the website with several browsers at once, each of them running
+# its own ExploreLoop over a shared state graph
+class ParallelExploreLoop:
+
+    def __init__(
+        self,
+        domain: str,
+        url: str,
+        openai_client: openai.OpenAI,
+        config: LoopConfig,
+        workers: int,
+    ):
+        self._domain = domain
+        self._url = url
+        self._openai_client = openai_client
+        self._config = config
+        self._workers = workers
+        self._graph = create_graph(config)
+
+    def start(self):
+        iterations = IterationCounter(self._config.iterations)
+        threads = [
+            threading.Thread(
+                target=self._run_worker, args=(iterations,), name=f"worker-{i}"
+            )
+            for i in range(self._workers)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def set_webstates(self, webstates: list[webstate.WebState]):
+        self._graph = restore_graph(self._openai_client, webstates, self._graph.journal)
+
+    def print_graph(self):
+        print_graph(self._graph.webstates)
+
+    def print_json(self, simple=True, embeddings_path: str | None = None):
+        print_json(self._graph.webstates, simple, embeddings_path)
+
+    def stop(self):
+        pass
+
+    def _run_worker(self, iterations: IterationCounter):
+        # Playwright objects can't be shared between threads, so each worker
+        # launches its own browser
+        explore_loop = ExploreLoop(
+            self._domain,
+            self._url,
+            self._openai_client,
+            self._config,
+            self._graph,
+            iterations,
+        )
+
+        try:
+            explore_loop.start()
+        except Exception:
+            logging.exception("Exploration worker failed")
+        finally:
+            explore_loop.stop()
+
+
+def create_graph(loop_config: LoopConfig) -> graph.StateGraph:
+    if not loop_config.journal_path:
+        return graph.StateGraph()
+
+    logging.info(f"Writing exploration journal to {loop_config.journal_path}")
+    return graph.StateGraph(journal=journal.Journal(loop_config.journal_path))
+
+
+def restore_graph(
+    openai_client: openai.OpenAI,
+    webstates: list[webstate.WebState],
+    journal: journal.Journal | None = None,
+) -> graph.StateGraph:
+    # Restored states may come without embeddings, e.g. when they were stripped
+    # from the saved graph to save space
+    webstates_missing = [ws for ws in webstates if len(ws.title_embedding) == 0]
+    title_embeddings = embeddings.embed_titles(
+        openai_client, [ws.title for ws in webstates_missing]
+    )
+    for ws, embedding in zip(webstates_missing, title_embeddings):
+        ws.title_embedding = embedding
+
+    embeddings_cache = embeddings.get_cache()
+    for ws in webstates:
+        embeddings_cache.put(
+            config.EMBEDDING_MODEL, ws.title, ws.title_embedding, persist=False
+        )
+
+    return graph.StateGraph(webstates, journal)
+
+
+def print_graph(webstates: list[webstate.WebState]):
+    print("digraph G {")
+
+    for ws in webstates:
+        ws_id = str(ws.ws_id).replace("-", "")
+        print(f'ws_{ws_id} [label="{ws.title}"]')
+
+    for ws in webstates:
+        ws_id = str(ws.ws_id).replace("-", "")
+        for transition in ws.transitions:
+            ws_new = transition.state_new
+            ws_new_id = str(ws_new.ws_id).replace("-", "")
+            print(
+                f'ws_{ws_id} -> ws_{ws_new_id} [label="{transition.action.description}"]'
+            )
+
+    print("}")
+
+
+def print_json(
+    webstates: list[webstate.WebState],
+    simple=True,
+    embeddings_path: str | None = None,
+):
+    if embeddings_path and not simple:
+        rows = webstate.save_embeddings(webstates, embeddings_path)
+        outputs = [ws.dict(simple, row) for ws, row in zip(webstates, rows)]
+    else:
+        outputs = [ws.dict(simple) for ws in webstates]
+    print(json.dumps(outputs, indent=4))
@@ -0,0 +1,220 @@
+import bisect
+import dataclasses
+import json
+import logging
+import os
+import threading
+
+from openai.types import CompletionUsage
+
+from . import config
+
+METRIC_PREFIX = "ai_web_explorer_llm"
+
+
+@dataclasses.dataclass
+class PromptMetrics:
+    calls: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    latency_sum: float = 0.0
+    # Number of requests per latency bucket, the last one is for latencies above
+    # all the bucket bounds
+    latency_counts: list[int] = dataclasses.field(default_factory=list)
+
+
+# LLM usage recorded per prompt name. Only requests sent to the API are counted
+# into tokens, costs and latencies, responses from the LLM cache are counted as
+# cache hits.
+class MetricsRegistry:
+
+    def __init__(
+        self,
+        latency_buckets: tuple[float, ...] = config.METRICS_LATENCY_BUCKETS,
+        prices: dict[str, tuple[float, float]] = config.MODEL_PRICES,
+    ):
+        self.latency_buckets = latency_buckets
+        self.prices = prices
+        self._metrics: dict[str, PromptMetrics] = {}
+        self._lock = threading.Lock()
+        self._unknown_models: set[str] = set()
+
+    def record_call(
+        self,
+        name: str,
+        model: str,
+        latency: float,
+        usage: CompletionUsage | None,
+        cached: bool = False,
+    ) -> None:
+        with self._lock:
+            metrics = self._get(name)
+            metrics.calls += 1
+
+            if cached:
+                metrics.cache_hits += 1
+                return
+
+            metrics.latency_sum += latency
+            metrics.latency_counts[
+                bisect.bisect_left(self.latency_buckets, latency)
+            ] += 1
+
+            if usage is not None:
+                metrics.input_tokens += usage.prompt_tokens
+                metrics.output_tokens += usage.completion_tokens
+                metrics.cost += self._cost(model, usage)
+
+    def record_retry(self, name: str) -> None:
+        with self._lock:
+            self._get(name).retries += 1
+
+    def record_error(self, name: str) -> None:
+        with self._lock:
+            self._get(name).errors += 1
+
+    def cost(self, model: str, usage: CompletionUsage | None) -> float:
+        with self._lock:
+            return self._cost(model, usage)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "latency_buckets": list(self.latency_buckets),
+                "prompts": {
+                    name: dataclasses.asdict(metrics)
+                    for name, metrics in sorted(self._metrics.items())
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            metrics_sorted = sorted(self._metrics.items())
+            lines = []
+
+            counters = [
+                ("calls_total", "LLM requests including cache hits", "calls"),
+                ("cache_hits_total", "LLM responses from the cache", "cache_hits"),
+                ("retries_total", "Repeated LLM requests", "retries"),
+                ("errors_total", "Failed LLM requests", "errors"),
+                ("cost_dollars_total", "Cost of LLM requests in USD", "cost"),
+            ]
+
+            for metric, description, field in counters:
+                lines.append(f"# HELP {METRIC_PREFIX}_{metric} {description}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+                for name, metrics in metrics_sorted:
+                    value = getattr(metrics, field)
+                    lines.append(f'{METRIC_PREFIX}_{metric}{{prompt="{name}"}} {value}')
+
+            lines.append(f"# HELP {METRIC_PREFIX}_tokens_total LLM tokens")
+            lines.append(f"# TYPE {METRIC_PREFIX}_tokens_total counter")
+            for name, metrics in metrics_sorted:
+                for token_type, value in [
+                    ("input", metrics.input_tokens),
+                    ("output", metrics.output_tokens),
+                ]:
+                    lines.append(
+                        f'{METRIC_PREFIX}_tokens_total{{prompt="{name}",'
+                        f'type="{token_type}"}} {value}'
+                    )
+
+            metric = f"{METRIC_PREFIX}_latency_seconds"
+            lines.append(f"# HELP {metric} Latency of LLM requests")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, metrics in metrics_sorted:
+                # Prometheus histogram buckets are cumulative
+                count = 0
+                bounds = [str(b) for b in self.latency_buckets] + ["+Inf"]
+                for bound, bucket_count in zip(bounds, metrics.latency_counts):
+                    count += bucket_count
+                    lines.append(
+                        f'{metric}_bucket{{prompt="{name}",le="{bound}"}} {count}'
+                    )
+                lines.append(f'{metric}_sum{{prompt="{name}"}} {metrics.latency_sum}')
+                lines.append(f'{metric}_count{{prompt="{name}"}} {count}')
+
+            return "\n".join(lines) + "\n"
+
+    def dump(
+        self,
+        json_path: str = config.METRICS_JSON_PATH,
+        prometheus_path: str = config.METRICS_PROMETHEUS_PATH,
+    ) -> None:
+        for path, content in [
+            (json_path, json.dumps(self.to_dict(), indent=2)),
+            (prometheus_path, self.to_prometheus()),
+        ]:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+
+        logging.info(f"LLM metrics written to {json_path} and {prometheus_path}")
+
+    def log_summary(self) -> None:
+        with self._lock:
+            metrics_sorted = sorted(self._metrics.items())
+
+        for name, metrics in metrics_sorted:
+            requests = metrics.calls - metrics.cache_hits
+            latency = metrics.latency_sum / requests if requests else 0.0
+            logging.info(
+                f"{name}: {metrics.calls} calls, {metrics.cache_hits} cached, "
+                f"{metrics.retries} retries, {metrics.errors} errors, "
+                f"{latency:.2f} s average latency, "
+                f"{metrics.input_tokens}/{metrics.output_tokens} tokens, "
+                f"${metrics.cost:.4f}"
+            )
+
+    def _get(self, name: str) -> PromptMetrics:
+        if name not in self._metrics:
+            self._metrics[name] = PromptMetrics(
+                latency_counts=[0] * (len(self.latency_buckets) + 1)
+            )
+        return self._metrics[name]
+
+    def _cost(self, model: str, usage: CompletionUsage | None) -> float:
+        if usage is None:
+            return 0.0
+
+        # Fine-tuned and dated models, e.g. ft:gpt-4o-mini-2024-07-18:org::id, are
+        # priced as the longest model name in the table they start with
+        model_base = model.split(":")[1] if model.startswith("ft:") else model
+        prefixes = [
+            m for m in self.prices if model_base == m or model_base.startswith(m + "-")
+        ]
+
+        if prefixes:
+            price_input, price_output = self.prices[max(prefixes, key=len)]
+        else:
+            if model not in self._unknown_models:
+                logging.warning(
+                    f"No price for model {model}, using the default price "
+                    f"{config.MODEL_PRICE_DEFAULT}"
+                )
+                self._unknown_models.add(model)
+            price_input, price_output = config.MODEL_PRICE_DEFAULT
+
+        return (
+            usage.prompt_tokens * price_input + usage.completion_tokens * price_output
+        ) / 1_000_000
+
+
+_registry: MetricsRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
@@ -0,0 +1,215 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import typing
+
+# Returned by span when profiling is off, so disabled spans cost one function call
+_NO_SPAN = contextlib.nullcontext()
+
+# Innermost open span, spans opened in threads of a pool get the span that was
+# open when the task was submitted through propagate
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    __slots__ = ("name", "tags", "parent", "thread_id", "start", "duration")
+
+    def __init__(self, name: str, tags: dict, parent: "Span | None"):
+        self.name = name
+        self.tags = tags
+        self.parent = parent
+        self.thread_id = threading.get_ident()
+        self.start = 0.0
+        self.duration = 0.0
+
+    def all_tags(self) -> dict:
+        # Tags of the parent spans apply to their children, e.g. the state and
+        # action of an iteration
+        tags = self.parent.all_tags() if self.parent else {}
+        tags.update(self.tags)
+        return tags
+
+
+# Timing spans of the phases of the explore loop. Spans nest within a thread and
+# across the thread pools of propagated tasks, finished spans are kept in memory
+# and written out at exit as a summary table and a trace in the Chrome trace event
+# format (chrome://tracing, Perfetto).
+class Profiler:
+
+    def __init__(self):
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self._thread_names: dict[int, str] = {}
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **tags) -> typing.Iterator[Span]:
+        span = Span(name, tags, _current_span.get())
+        token = _current_span.set(span)
+        span.start = time.perf_counter()
+
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            with self._lock:
+                self._spans.append(span)
+                if span.thread_id not in self._thread_names:
+                    self._thread_names[span.thread_id] = threading.current_thread().name
+
+    def tag(self, **tags) -> None:
+        # Tags the outermost open span, usually the iteration
+        span = _current_span.get()
+        if span is None:
+            return
+        while span.parent is not None:
+            span = span.parent
+        span.tags.update(tags)
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            spans = list(self._spans)
+
+        # Self time is the time of a span when none of its children is running,
+        # children in a thread pool run at the same time
+        children: dict[int, list[Span]] = {}
+        for span in spans:
+            if span.parent is not None:
+                children.setdefault(id(span.parent), []).append(span)
+
+        children_time: dict[int, float] = {}
+        for parent_id, spans_child in children.items():
+            covered = 0.0
+            covered_until = float("-inf")
+            for span in sorted(spans_child, key=lambda s: s.start):
+                end = span.start + span.duration
+                covered += max(0.0, end - max(span.start, covered_until))
+                covered_until = max(covered_until, end)
+            children_time[parent_id] = covered
+
+        phases: dict[str, dict] = {}
+        for span in spans:
+            phase = phases.setdefault(
+                span.name,
+                {"name": span.name, "count": 0, "total": 0.0, "self": 0.0, "max": 0.0},
+            )
+            phase["count"] += 1
+            phase["total"] += span.duration
+            phase["self"] += span.duration - children_time.get(id(span), 0.0)
+            phase["max"] = max(phase["max"], span.duration)
+
+        return sorted(phases.values(), key=lambda p: p["self"], reverse=True)
+
+    def format_summary(self) -> str:
+        phases = self.summary()
+        total_self = sum(p["self"] for p in phases) or 1.0
+        lines = [
+            f"{'phase':<24} {'count':>7} {'total s':>10} {'self s':>10} "
+            f"{'self %':>7} {'mean ms':>10} {'max ms':>10}"
+        ]
+
+        for p in phases:
+            lines.append(
+                f"{p['name']:<24} {p['count']:>7} {p['total']:>10.2f} "
+                f"{p['self']:>10.2f} {p['self'] / total_self * 100:>7.1f} "
+                f"{p['total'] / p['count'] * 1000:>10.1f} {p['max'] * 1000:>10.1f}"
+            )
+
+        return "\n".join(lines)
+
+    def write_trace(self, path: str) -> None:
+        with self._lock:
+            spans = list(self._spans)
+            thread_names = dict(self._thread_names)
+
+        pid = os.getpid()
+        events: list[dict] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in thread_names.items()
+        ]
+
+        for span in sorted(spans, key=lambda s: s.start):
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "explore",
+                    "ph": "X",
+                    "ts": (span.start - self._start) * 1_000_000,
+                    "dur": span.duration * 1_000_000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {k: str(v) for k, v in span.all_tags().items()},
+                }
+            )
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        logging.info(f"Profile trace with {len(spans)} spans written to {path}")
+
+
+_profiler: Profiler | None = None
+
+
+def enable() -> Profiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+def span(name: str, **tags) -> typing.ContextManager:
+    if _profiler is None:
+        return _NO_SPAN
+    return _profiler.span(name, **tags)
+
+
+def tag(**tags) -> None:
+    if _profiler is not None:
+        _profiler.tag(**tags)
+
+
+def traced(name: str, **tags) -> typing.Callable:
+    # Decorated functions run in a span
+    def decorator(function: typing.Callable) -> typing.Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.span(name, **tags):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def propagate(function: typing.Callable) -> typing.Callable:
+    # Wraps a task submitted to a thread pool, so its spans are nested in the span
+    # open when it was submitted and carry its tags, e.g. the state and action
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        # A context can't be entered by several threads at once
+        return context.copy().run(function, *args, **kwargs)
+
+    return wrapper
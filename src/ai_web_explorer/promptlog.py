@@ -0,0 +1,110 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import typing
+
+from . import background
+from . import config
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+# Prompt logs are serialized and written by a background thread, so logging a
+# prompt only puts the record into a queue.
+class PromptLogWriter(background.BackgroundWriter):
+
+    def __init__(
+        self,
+        path: str,
+        queue_size: int = config.PROMPT_LOGS_QUEUE_SIZE,
+        max_size: int = config.PROMPT_LOGS_MAX_SIZE,
+        compression: str = config.PROMPT_LOGS_COMPRESSION,
+    ):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown prompt log compression {compression}")
+
+        self.path = path
+        self._max_size = max_size
+        self._compression = compression
+        self._file: typing.TextIO | None = None
+        super().__init__("prompt-log-writer", queue_size)
+
+    def write(self, record: dict) -> None:
+        self.put(record)
+
+    def _write_batch(self, records: list[dict]) -> None:
+        lines = []
+
+        for record in records:
+            try:
+                lines.append(json.dumps(record, default=_to_json) + "\n")
+            except Exception:
+                logging.exception("Failed to serialize prompt log record")
+
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a")
+
+        self._file.write("".join(lines))
+        self._file.flush()
+
+        if self._file.tell() >= self._max_size:
+            self._file.close()
+            self._file = None
+            try:
+                self._rotate()
+            except Exception:
+                logging.exception("Failed to rotate prompt logs")
+
+    def _finish(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def _rotate(self) -> None:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base, extension = os.path.splitext(self.path)
+        rotated_path = f"{base}.{timestamp}{extension}"
+        os.replace(self.path, rotated_path)
+
+        if self._compression == "none":
+            return
+
+        if self._compression == "gzip":
+            compressed_path = f"{rotated_path}.gz"
+            open_compressed = gzip.open
+        else:
+            # Optional dependency only needed for zstd compression
+            import zstandard
+
+            compressed_path = f"{rotated_path}.zst"
+            open_compressed = zstandard.open
+
+        with open(rotated_path, "rb") as f_in, open_compressed(
+            compressed_path, "wb"
+        ) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        os.remove(rotated_path)
+
+
+def _to_json(value: typing.Any) -> typing.Any:
+    # Responses and messages returned by the OpenAI client are pydantic models
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_writer: PromptLogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> PromptLogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = PromptLogWriter(config.PROMPT_LOGS_PATH)
+        return _writer
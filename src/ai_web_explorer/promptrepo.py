@@ -1,13 +1,20 @@
-import base64
+import copy
 import dataclasses
+import functools
+import os
+import string
+import threading
 
 import openai
 from openai.types import chat, shared_params
 import yaml
 import datetime
-import json
 
 from . import config
+from . import images
+from . import llmcache
+from . import metrics
+from . import promptlog
 
 
 @dataclasses.dataclass
@@ -17,11 +24,23 @@ class Prompt:
     temperature: float
     model: str
     max_tokens: int
+    name: str = ""
+    image_policy: images.ImagePolicy = dataclasses.field(
+        default_factory=images.ImagePolicy
+    )
 
-    @property
+    @functools.cached_property
     def tools(self) -> list[chat.ChatCompletionToolParam]:
         return [{"type": "function", "function": f} for f in self.functions]
 
+    @functools.cached_property
+    def tool_choice(
+        self,
+    ) -> chat.ChatCompletionToolChoiceOptionParam | openai.NotGiven:
+        if len(self.functions) != 1:
+            return openai.NOT_GIVEN
+        return {"type": "function", "function": {"name": self.functions[0]["name"]}}
+
     def prompt_with_data(self, **data) -> str:
         return self.prompt_text.format(**data)
 
@@ -35,36 +54,27 @@ class Prompt:
             if not isinstance(image_bytes, list):
                 image_bytes = [image_bytes]
 
-            for image in image_bytes:
-                image_encoded = base64.b64encode(image).decode("utf-8")
-                image_encoded = f"data:image/png;base64,{image_encoded}"
-                content.append(
-                    {"type": "image_url", "image_url": {"url": image_encoded}}
-                )
+            images_encoded = images.get_encoder().encode(image_bytes, self.image_policy)
+
+            for image_encoded in images_encoded:
+                image_url = {"url": image_encoded}
+                if self.image_policy.detail is not None:
+                    image_url["detail"] = self.image_policy.detail
+                content.append({"type": "image_url", "image_url": image_url})
 
         message: chat.ChatCompletionMessageParam = {
             "role": "user",
             "content": content,  # type: ignore
         }
 
-        tools: list[chat.ChatCompletionToolParam] | openai.NotGiven = (
-            [{"type": "function", "function": f} for f in self.functions]
-            if len(self.functions) > 0
-            else openai.NOT_GIVEN
-        )
-
-        tool_choice: chat.ChatCompletionToolChoiceOptionParam | openai.NotGiven = (
-            {"type": "function", "function": {"name": self.functions[0]["name"]}}
-            if len(self.functions) == 1
-            else openai.NOT_GIVEN
-        )
-
-        completion = client.chat.completions.create(
+        completion = llmcache.create_completion(
+            client,
+            prompt_name=self.name,
             model=self.model,
             messages=[message],
             temperature=self.temperature,
-            tools=tools,
-            tool_choice=tool_choice,
+            tools=self.tools if self.tools else openai.NOT_GIVEN,
+            tool_choice=self.tool_choice,
             max_tokens=self.max_tokens,
         )
 
@@ -77,62 +87,90 @@ class Prompt:
         return response
 
     def log_prompt(self, messages, response) -> None:
-        for i, message in enumerate(messages):
-            if not isinstance(message, dict):
-                message = message.model_dump()
-            if isinstance(message["content"], list):
-                message["content"] = message["content"][0]
-            messages[i] = message
-
-        with open(config.PROMPT_LOGS_PATH, "a") as f:
-            log_record = {
+        # The caller may keep using its messages, so they are copied, not modified.
+        # Only the text of multimodal messages is logged.
+        messages_logged = [
+            (
+                {**message, "content": message["content"][0]}
+                if isinstance(message, dict) and isinstance(message["content"], list)
+                else message
+            )
+            for message in messages
+        ]
+
+        promptlog.get_writer().write(
+            {
                 "timestamp": datetime.datetime.now().isoformat(),
-                "messages": messages,
-                "response": response.model_dump(),
+                "messages": messages_logged,
+                "response": response,
                 "functions": self.functions,
                 "temperature": self.temperature,
                 "model": self.model,
             }
-
-            f.write(json.dumps(log_record) + "\n")
+        )
 
     def get_last_price(self) -> float:
-        if self.model == "gpt-4o":
-            unit_price_input = 5.0
-            unit_price_output = 15.0
-        else:
-            unit_price_input = 0.15
-            unit_price_output = 0.60
-
-
         if not hasattr(self, "_last_completion"):
             raise ValueError("No last completion to get price from")
 
-        if not self._last_completion.usage:
-            return 0.0
-
-        input_tokens = self._last_completion.usage.prompt_tokens
-        output_tokens = self._last_completion.usage.completion_tokens
+        return metrics.get_registry().cost(self.model, self._last_completion.usage)
 
-        input_price = input_tokens * unit_price_input / 1_000_000
-        output_price = output_tokens * unit_price_output / 1_000_000
 
-        return input_price + output_price
+# Parsed prompt files keyed by path, reloaded when the file modification time changes
+_prompt_files: dict[str, tuple[int, dict, dict[str, Prompt]]] = {}
+_prompt_files_lock = threading.Lock()
 
 
 def get_prompt(name: str, prompts_path: str = config.PROMPTS_PATH) -> Prompt:
+    mtime = os.stat(prompts_path).st_mtime_ns
+
+    with _prompt_files_lock:
+        if prompts_path not in _prompt_files or _prompt_files[prompts_path][0] != mtime:
+            _prompt_files[prompts_path] = (mtime, _load_prompts(prompts_path), {})
+
+        _, prompts, prompts_parsed = _prompt_files[prompts_path]
+
+        if name not in prompts_parsed:
+            prompts_parsed[name] = _parse_prompt(name, prompts)
+
+    # Callers are free to modify the returned prompt (e.g. change its model),
+    # so each of them gets its own shallow copy including precomputed tools
+    return copy.copy(prompts_parsed[name])
+
+
+def _load_prompts(prompts_path: str) -> dict:
     with open(prompts_path) as f:
-        prompts = yaml.safe_load(f)
+        return yaml.safe_load(f)
+
+
+def _parse_prompt(name: str, prompts: dict) -> Prompt:
     if name not in prompts:
         raise ValueError(f"Prompt {name} not found")
     prompt_raw = prompts[name]
     if "prompt" not in prompt_raw:
         raise ValueError(f"Prompt {name} is missing a prompt")
+
+    try:
+        list(string.Formatter().parse(prompt_raw["prompt"]))
+    except ValueError as e:
+        raise ValueError(f"Prompt {name} has an invalid template: {e}")
+
+    try:
+        image_policy = images.ImagePolicy.from_dict(prompt_raw.get("image", {}))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Prompt {name} has invalid image settings: {e}")
+
     prompt = Prompt(
         prompt_raw["prompt"],
         prompt_raw.get("functions", []),
         prompt_raw.get("temperature", config.TEMPERATURE_DEFAULT),
         prompt_raw.get("model", config.MODEL_DEFAULT),
         prompt_raw.get("max_tokens", config.MAX_TOKENS_DEFAULT),
+        name,
+        image_policy,
     )
+
+    # Precompute request structures so copies returned by get_prompt share them
+    prompt.tools
+    prompt.tool_choice
     return prompt
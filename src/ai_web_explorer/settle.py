@@ -0,0 +1,67 @@
+import dataclasses
+import logging
+import time
+
+import playwright.sync_api
+
+from . import config
+from . import profiler
+
+
+@dataclasses.dataclass
+class SettleStats:
+    # Time spent waiting for the page to settle
+    waited: float = 0.0
+    # Time saved compared to the fixed sleeps the waits replaced
+    saved: float = 0.0
+
+    def reset(self):
+        self.waited = 0.0
+        self.saved = 0.0
+
+
+# Waits until the page is quiet - loaded, with no pending requests, no DOM changes for
+# a while and no running animations - instead of sleeping for a fixed time
+class Settler:
+
+    def __init__(
+        self, page: playwright.sync_api.Page, stats: SettleStats | None = None
+    ):
+        self._page = page
+        self.stats = stats or SettleStats()
+
+    @profiler.traced("settle")
+    def settle(self, replaced: float = 0.0, fresh: bool = False) -> float:
+        # replaced is the duration of the fixed sleep this wait is used instead of,
+        # fresh waits for a full quiet period even if the page is already quiet
+        start = time.perf_counter()
+        # Pages that never go quiet (looping animations, polling) wait only a little
+        # longer than the sleep they replace
+        timeout = config.SETTLE_TIMEOUT
+        if replaced > 0:
+            timeout = min(timeout, replaced * config.SETTLE_TIMEOUT_FACTOR)
+
+        try:
+            if fresh:
+                self._page.evaluate(
+                    "window.markPageActivity && window.markPageActivity()"
+                )
+            self._page.wait_for_function(
+                "([quietTime, requestTimeout]) => window.isPageSettled"
+                " && window.isPageSettled(quietTime, requestTimeout)",
+                arg=[
+                    config.SETTLE_QUIET_TIME * 1000,
+                    config.SETTLE_REQUEST_TIMEOUT * 1000,
+                ],
+                timeout=timeout * 1000,
+                polling=config.SETTLE_POLLING_TIME * 1000,
+            )
+        except playwright.sync_api.TimeoutError:
+            logging.info(f"Page did not settle within {timeout} s")
+        except playwright.sync_api.Error as e:
+            logging.warning(f"Error when waiting for the page to settle: {e}")
+
+        duration = time.perf_counter() - start
+        self.stats.waited += duration
+        self.stats.saved += replaced - duration
+        return duration
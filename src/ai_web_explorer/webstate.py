@@ -1,20 +1,43 @@
+import contextlib
 import dataclasses
+import gc
 import json
+import os
 import typing
 import uuid
 from openai.types.chat import ChatCompletionMessageToolCall
 import numpy as np
 
+from . import config
+
 ActionStatus = typing.Literal["none", "success", "failure"]
 
+# Size of the chunks a saved graph is read in
+JSON_CHUNK_SIZE = 1024 * 1024
+
+
+# Codes of action statuses in the status arrays of states
+ACTION_STATUSES: tuple[ActionStatus, ...] = typing.get_args(ActionStatus)
+ACTION_STATUS_CODES = {status: code for code, status in enumerate(ACTION_STATUSES)}
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Action:
     description: str
     part: int
     priority: int
     status: ActionStatus = dataclasses.field(default="none")
     function_calls: list[dict] = dataclasses.field(default_factory=list)
+    # State whose priority and status arrays contain this action
+    _state: "WebState | None" = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _index: int = dataclasses.field(default=-1, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        object.__setattr__(self, name, value)
+        if name in ("priority", "status") and getattr(self, "_state", None):
+            self._state._update_action(self)  # type: ignore
 
     def dict(self, simple=False):
 
@@ -40,7 +63,7 @@ class Action:
         )
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class StateTransition:
     action: Action
     state_new: "WebState"
@@ -52,87 +75,358 @@ class StateTransition:
         }
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class WebState:
     title: str
-    title_embedding: list[float]
+    title_embedding: np.ndarray = dataclasses.field(compare=False)
     urls: list[str]
     description: list[dict]
     actions: list[Action]
     transitions: list[StateTransition]
     ws_id: uuid.UUID = dataclasses.field(default_factory=uuid.uuid4)
+    # Priorities and status codes of the actions, so an action can be chosen without
+    # iterating over the action objects. Claimed actions are being executed by a worker.
+    _priorities: np.ndarray = dataclasses.field(
+        default_factory=lambda: np.empty(0, dtype=np.int16),
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    _statuses: np.ndarray = dataclasses.field(
+        default_factory=lambda: np.empty(0, dtype=np.int8),
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    _claimed: np.ndarray = dataclasses.field(
+        default_factory=lambda: np.empty(0, dtype=bool),
+        init=False,
+        repr=False,
+        compare=False,
+    )
+    _actions_indexed: list[Action] | None = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        if name == "title_embedding":
+            # Memory mapped embeddings are already float32 and are not copied
+            value = np.asarray(value, dtype=np.float32)
+        object.__setattr__(self, name, value)
 
     @property
     def random_action(self) -> None | Action:
-        candidates_obvious = [
-            action
-            for action in self.actions
-            if action.status == "none" and action.priority >= 11
-        ]
-
-        if candidates_obvious:
-            candidates_obvious = sorted(
-                candidates_obvious, key=lambda x: x.priority, reverse=True
+        return self.choose_action()
+
+    def choose_action(self, claim: bool = False) -> None | Action:
+        self._index_actions()
+        candidates = (self._statuses == ACTION_STATUS_CODES["none"]) & ~self._claimed
+
+        if not candidates.any():
+            return None
+
+        candidates_obvious = candidates & (self._priorities >= 11)
+
+        if candidates_obvious.any():
+            # The first of the actions with the highest priority
+            index = int(np.argmax(np.where(candidates_obvious, self._priorities, -1)))
+        else:
+            indices = np.flatnonzero(candidates)
+            probabilities = self._priorities[indices].astype(np.float64)
+            total = probabilities.sum()
+            probabilities = (
+                probabilities / total
+                if total > 0
+                else np.full(len(indices), 1 / len(indices))
             )
-            return candidates_obvious[0]
-        candidates = [action for action in self.actions if action.status == "none"]
-        probabilities = np.array([action.priority for action in candidates])
-        probabilities = probabilities / probabilities.sum()
+            index = int(np.random.choice(indices, p=probabilities))
+
+        if claim:
+            self._claimed[index] = True
+
+        return self.actions[index]
 
-        if candidates:
-            return np.random.choice(np.array(candidates), p=probabilities)  # type: ignore
+    def _index_actions(self) -> None:
+        # Actions may be replaced or appended to after the state is created
+        if self.actions is self._actions_indexed and len(self.actions) == len(
+            self._priorities
+        ):
+            return
 
-        return None
+        for i, action in enumerate(self.actions):
+            object.__setattr__(action, "_state", self)
+            object.__setattr__(action, "_index", i)
+
+        claimed = np.zeros(len(self.actions), dtype=bool)
+        if self.actions is self._actions_indexed:
+            claimed[: len(self._claimed)] = self._claimed[: len(claimed)]
+
+        self._priorities = np.array(
+            [action.priority for action in self.actions], dtype=np.int16
+        )
+        self._statuses = np.array(
+            [ACTION_STATUS_CODES[action.status] for action in self.actions],
+            dtype=np.int8,
+        )
+        self._claimed = claimed
+        self._actions_indexed = self.actions
+
+    def _update_action(self, action: Action) -> None:
+        # Arrays of replaced actions are rebuilt on the next choice instead
+        if (
+            self.actions is not self._actions_indexed
+            or action._index >= len(self._priorities)
+            or self.actions[action._index] is not action
+        ):
+            return
+        self._priorities[action._index] = action.priority
+        self._statuses[action._index] = ACTION_STATUS_CODES[action.status]
 
     def cosine_distance(self, embedding: list[float]):
         return np.dot(self.title_embedding, embedding) / (
             np.linalg.norm(self.title_embedding) * np.linalg.norm(embedding)
         )
 
-    def dict(self, simple=False):
+    def dict(self, simple=False, embedding_row: int | None = None):
         d = {
             "ws_id": str(self.ws_id),
             "title": self.title,
-            "urls": self.urls,
+            # Copied, so a journal snapshot is not changed while it is written
+            "urls": list(self.urls),
             "description": self.description,
             "actions": [a.dict(simple) for a in self.actions],
             "transitions": [t.dict(simple) for t in self.transitions],
         }
 
-        if not simple:
-            d["title_embedding"] = self.title_embedding
+        if not simple and embedding_row is not None:
+            # The embedding is stored in a separate embeddings file
+            d["title_embedding_row"] = embedding_row
+        elif not simple:
+            d["title_embedding"] = self.title_embedding.tolist()
 
         return d
 
+    @staticmethod
+    def from_dict(ws_raw, embeddings: np.ndarray | None = None) -> "WebState":
+        # Transitions reference other states, so they are restored separately
+        if "title_embedding_row" in ws_raw:
+            if embeddings is None:
+                raise ValueError("State references a missing embeddings file")
+            title_embedding = embeddings[ws_raw["title_embedding_row"]]
+        else:
+            title_embedding = ws_raw.get("title_embedding", [])
 
-def load_states_from_file(file_path: str) -> list[WebState]:
-    with open(file_path, "r") as f:
-        json_string = f.read()
-        print(json_string)
-        webstates_raw = json.loads(json_string)
-
-    webstates = []
-    transitions_raw = []
-
-    for ws_raw in webstates_raw:
-        ws = WebState(
+        return WebState(
             title=ws_raw["title"],
-            title_embedding=ws_raw["title_embedding"],
+            title_embedding=title_embedding,
             urls=ws_raw["urls"],
             description=ws_raw["description"],
             actions=[Action.from_dict(a) for a in ws_raw["actions"]],
             transitions=[],
             ws_id=uuid.UUID(ws_raw["ws_id"]),
         )
-        webstates.append(ws)
-        transitions_raw.extend((uuid.UUID(ws_raw["ws_id"]), t) for t in ws_raw["transitions"] if t)
 
+
+class StateIndex:
+
+    def __init__(
+        self,
+        states: list[WebState] | None = None,
+        backend: str = config.STATE_INDEX_BACKEND,
+    ):
+        if backend not in ("numpy", "hnswlib"):
+            raise ValueError(f"Unknown state index backend {backend}")
+
+        self._backend = backend
+        self._states: list[WebState] = []
+        # Normalized embeddings, rows after the number of states are preallocated space
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+        self._ann_index = None
+
+        if states:
+            self.extend(states)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def add(self, ws: WebState) -> None:
+        self.extend([ws])
+
+    def extend(self, states: list[WebState]) -> None:
+        embeddings = np.array([ws.title_embedding for ws in states], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        start, end = len(self._states), len(self._states) + len(states)
+
+        if end > len(self._embeddings):
+            self._grow(end, embeddings.shape[1])
+
+        self._embeddings[start:end] = embeddings
+
+        if self._ann_index is not None:
+            self._ann_index.add_items(embeddings, np.arange(start, end))
+
+        self._states.extend(states)
+
+    def find_similar(self, embedding: list[float], threshold: float) -> WebState | None:
+        if not self._states:
+            return None
+
+        query = _normalize(embedding)
+
+        if self._ann_index is not None:
+            labels, distances = self._ann_index.knn_query(query[np.newaxis], k=1)
+            best, similarity = int(labels[0][0]), 1.0 - float(distances[0][0])
+        else:
+            similarities = self._embeddings[: len(self._states)] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+        return self._states[best] if similarity > threshold else None
+
+    def _grow(self, size: int, dimensions: int) -> None:
+        capacity = max(1024, len(self._embeddings) * 2, size)
+        embeddings = np.empty((capacity, dimensions), dtype=np.float32)
+        if self._states:
+            embeddings[: len(self._states)] = self._embeddings[: len(self._states)]
+        self._embeddings = embeddings
+
+        if self._backend != "hnswlib":
+            return
+
+        if self._ann_index is None:
+            # Optional dependency only needed for the approximate backend
+            import hnswlib
+
+            self._ann_index = hnswlib.Index(space="cosine", dim=dimensions)
+            self._ann_index.init_index(max_elements=capacity)
+        else:
+            self._ann_index.resize_index(capacity)
+
+
+def _normalize(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def load_states_from_file(
+    file_path: str, embeddings_path: str | None = None
+) -> list[WebState]:
+    webstates = []
+    webstates_by_id = {}
+    transitions_raw = []
+    embeddings_path = embeddings_path or os.path.splitext(file_path)[0] + ".npy"
+    embeddings = None
+
+    if os.path.exists(embeddings_path):
+        # States keep views of the mapped file instead of their own copies of the
+        # embeddings, only the similarity index holds normalized copies in memory
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+
+    with open(file_path, "r") as f, gc_paused():
+        for ws_raw in iterate_json_array(f):
+            ws = WebState.from_dict(ws_raw, embeddings)
+            webstates.append(ws)
+            webstates_by_id[ws.ws_id] = ws
+            transitions_raw.extend((ws.ws_id, t) for t in ws_raw["transitions"] if t)
+
+        link_transitions(webstates_by_id, transitions_raw)
+
+    return webstates
+
+
+@contextlib.contextmanager
+def gc_paused() -> typing.Iterator[None]:
+    # Loading creates millions of objects that live for the rest of the
+    # exploration, the garbage collector would repeatedly traverse them all
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def save_embeddings(webstates: list[WebState], file_path: str) -> list[int | None]:
+    # Returns the rows of the states in the file, states without an embedding
+    # are not stored
+    rows: list[int | None] = []
+    embeddings = []
+
+    for ws in webstates:
+        if len(ws.title_embedding) == 0:
+            rows.append(None)
+            continue
+        rows.append(len(embeddings))
+        embeddings.append(ws.title_embedding)
+
+    # np.save would append .npy to other paths, but the path is restored as given
+    with open(file_path, "wb") as f:
+        np.save(f, np.array(embeddings, dtype=np.float32))
+    return rows
+
+
+def link_transitions(
+    webstates_by_id: dict[uuid.UUID, WebState],
+    transitions_raw: list[tuple[uuid.UUID, dict]],
+) -> None:
+    # Transitions can point to states defined later, so they are added once all
+    # states are loaded
     for state_id, transition_raw in transitions_raw:
-        state_current = next(ws for ws in webstates if ws.ws_id == state_id)
         action = Action.from_dict(transition_raw["action"])
-        state_new = next(
-            ws for ws in webstates if ws.ws_id == uuid.UUID(transition_raw["state_new"])
-        )
-        state_current.transitions.append(StateTransition(action, state_new))
+        state_new = webstates_by_id[uuid.UUID(transition_raw["state_new"])]
+        webstates_by_id[state_id].transitions.append(StateTransition(action, state_new))
 
-    return webstates
+
+def iterate_json_array(
+    f: typing.TextIO, chunk_size: int = JSON_CHUNK_SIZE
+) -> typing.Iterator[typing.Any]:
+    # Decodes items of a top-level JSON array one by one, so the text of the whole
+    # file is never held in memory
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array")
+
+    position = 1
+    eof = False
+
+    while True:
+        # Skip whitespace and separators, loading more text if the buffer runs out
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer = f.read(chunk_size)
+            position = 0
+            eof = not buffer
+
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+
+        if buffer[position] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+            # A number may continue in the next chunk, the item is complete only
+            # when followed by a separator
+            complete = eof or (end < len(buffer) and buffer[end] in " \t\r\n,]")
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+
+        if not complete:
+            # The item continues in the next chunk, large items are read in
+            # increasingly large chunks so they are not decoded too many times
+            chunk = f.read(max(chunk_size, len(buffer) - position))
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield item
+        position = end
@@ -1,4 +1,9 @@
 import os
 
+from ai_web_explorer import config
+
 TESTS_PATH = os.path.dirname(os.path.dirname(__file__))
 DATA_PATH = os.path.join(TESTS_PATH, "data")
+
+# Results of evaluated samples reused by later runs of the evaluations
+EVAL_RESULTS_PATH = os.path.join(config.DATA_PATH, "eval_results")
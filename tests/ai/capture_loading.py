@@ -0,0 +1,84 @@
+import argparse
+import dataclasses
+import json
+import os
+import re
+import time
+
+import playwright.sync_api
+
+from ai_web_explorer import config
+from ai_web_explorer import html
+from ai_web_explorer import loading
+
+# Captures screenshots of pages while and after they load together with the
+# loading signals of the page at the same moment, stored as <name>.png and
+# <name>.json. Captured pairs are sorted by hand into tests/data/loading/yes
+# and tests/data/loading/no.
+parser = argparse.ArgumentParser(
+    description="Capture screenshots and loading signals for the is_loading evaluation"
+)
+parser.add_argument("urls", nargs="+", help="URLs of the captured pages")
+parser.add_argument(
+    "--output",
+    "-o",
+    type=str,
+    help="Directory of the captured screenshots and signals",
+    default=os.path.join(os.path.dirname(__file__), "..", "data", "loading", "new"),
+)
+parser.add_argument(
+    "--delays",
+    "-d",
+    type=float,
+    nargs="+",
+    help="Seconds after the navigation starts when the page is captured",
+    default=[0.2, 0.5, 1.0, 3.0],
+)
+
+
+def capture(
+    browser: playwright.sync_api.Browser, url: str, delays: list[float], output: str
+):
+    name = re.sub(r"[^a-zA-Z0-9]+", "-", url.split("://")[-1]).strip("-")
+
+    # Every delay gets a fresh context, so the page is never served from a cache
+    for delay in delays:
+        context = browser.new_context()
+        context.add_init_script(html.JS_FUNCTIONS)
+        page = context.new_page()
+        page.set_viewport_size(
+            {"width": config.BROWSER_SIZE[0], "height": config.BROWSER_SIZE[1]}
+        )
+        start = time.monotonic()
+        page.goto(url, wait_until="commit")
+        page.wait_for_timeout(max(0.0, delay - (time.monotonic() - start)) * 1000)
+
+        signals = loading.get_loading_signals(page)
+        screenshot = page.screenshot()
+        context.close()
+
+        if signals is None:
+            print(f"No loading signals for {url} after {delay} s, skipping")
+            continue
+
+        sample_path = os.path.join(output, f"{name}-{int(delay * 1000)}ms")
+        with open(f"{sample_path}.png", "wb") as f:
+            f.write(screenshot)
+        with open(f"{sample_path}.json", "w") as f:
+            json.dump(dataclasses.asdict(signals), f, indent=4)
+        print(f"Captured {sample_path}: {signals}")
+
+
+def main():
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
+
+    with playwright.sync_api.sync_playwright() as pw:
+        browser = pw.chromium.launch(headless=True)
+        for url in args.urls:
+            capture(browser, url, args.delays, args.output)
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
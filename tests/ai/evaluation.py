@@ -0,0 +1,276 @@
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import typing
+
+import openai
+from openai.types import chat
+
+from ai_web_explorer import config
+from ai_web_explorer import images
+from ai_web_explorer import promptrepo
+import base
+
+# Errors after which a request is sent again, the rest fail the evaluation
+RETRIED_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+@dataclasses.dataclass
+class Sample:
+    sample_id: str
+    expected: typing.Any
+    data: dict = dataclasses.field(default_factory=dict)
+    images: list[bytes] | None = dataclasses.field(default=None)
+
+
+@dataclasses.dataclass
+class Configuration:
+    name: str
+    prompt_name: str
+    model: str | None = dataclasses.field(default=None)
+    # Whether the screenshots of the samples are sent with the prompt
+    image: bool = dataclasses.field(default=True)
+    # Overrides the image settings of the prompt
+    image_policy: images.ImagePolicy | None = dataclasses.field(default=None)
+    prompts_path: str = dataclasses.field(default=config.PROMPTS_PATH_TEST)
+
+
+@dataclasses.dataclass
+class SampleResult:
+    sample: Sample
+    message: chat.ChatCompletionMessage
+    price: float
+    cached: bool
+
+
+@dataclasses.dataclass
+class Report:
+    configuration: Configuration
+    results: list[SampleResult]
+
+    @property
+    def price(self) -> float:
+        return sum(r.price for r in self.results)
+
+    @property
+    def price_new(self) -> float:
+        # Price of the requests actually sent in this run
+        return sum(r.price for r in self.results if not r.cached)
+
+    @property
+    def cached(self) -> int:
+        return sum(r.cached for r in self.results)
+
+
+# Evaluates prompt configurations on samples loaded once. Requests of all
+# configurations share one pool of workers, rate limited requests are retried with
+# exponential backoff. Every result is appended to a JSONL file as soon as it
+# arrives and reused by later runs, so an interrupted or extended sweep only sends
+# requests for new (prompt, model, sample) combinations. Changing the text of
+# a prompt or the contents of a sample invalidates its stored results.
+class Evaluator:
+
+    def __init__(
+        self,
+        experiment: str,
+        client: openai.OpenAI | None = None,
+        max_workers: int = 8,
+        max_retries: int = 6,
+        results_path: str = base.EVAL_RESULTS_PATH,
+    ):
+        # Retries are done by the evaluator, so they don't block other requests
+        self._client = client or openai.OpenAI(max_retries=0)
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._path = os.path.join(results_path, f"{experiment}.jsonl")
+        self._lock = threading.Lock()
+        self._stored = self._load()
+
+    def evaluate(
+        self, configurations: list[Configuration], samples: list[Sample]
+    ) -> list[Report]:
+        results: dict[str, list[SampleResult | None]] = {
+            c.name: [None] * len(samples) for c in configurations
+        }
+
+        with concurrent.futures.ThreadPoolExecutor(self._max_workers) as pool:
+            futures = {}
+
+            # Contents of the samples are hashed once for all configurations
+            sample_hashes = [_sample_hash(sample) for sample in samples]
+
+            for configuration in configurations:
+                for i, sample in enumerate(samples):
+                    key = self._key(configuration, sample, sample_hashes[i])
+                    if key in self._stored:
+                        record = self._stored[key]
+                        results[configuration.name][i] = SampleResult(
+                            sample,
+                            chat.ChatCompletionMessage.model_validate(
+                                record["message"]
+                            ),
+                            record["price"],
+                            cached=True,
+                        )
+                    else:
+                        future = pool.submit(self._run, configuration, sample, key)
+                        futures[future] = (configuration.name, i)
+
+            logging.info(
+                f"Evaluating {len(futures)} samples, "
+                f"{len(configurations) * len(samples) - len(futures)} stored"
+            )
+
+            for future in concurrent.futures.as_completed(futures):
+                name, i = futures[future]
+                results[name][i] = future.result()
+
+        return [
+            Report(c, [r for r in results[c.name] if r is not None])
+            for c in configurations
+        ]
+
+    def _run(self, configuration: Configuration, sample: Sample, key: str):
+        prompt = get_prompt(configuration)
+
+        for attempt in range(self._max_retries + 1):
+            try:
+                response = prompt.execute_prompt(
+                    self._client,
+                    image_bytes=sample.images if configuration.image else None,
+                    **sample.data,
+                )
+                break
+            except RETRIED_ERRORS as e:
+                if attempt == self._max_retries:
+                    raise
+                time.sleep(_retry_delay(e, attempt))
+
+        result = SampleResult(
+            sample, response.message, prompt.get_last_price(), cached=False
+        )
+        self._store(
+            key,
+            {
+                "key": key,
+                "configuration": configuration.name,
+                "sample_id": sample.sample_id,
+                "message": response.message.model_dump(exclude_none=True),
+                "price": result.price,
+            },
+        )
+        return result
+
+    def _key(
+        self, configuration: Configuration, sample: Sample, sample_hash: str
+    ) -> str:
+        prompt = get_prompt(configuration)
+        payload = {
+            "prompt": prompt.prompt_text,
+            "functions": prompt.functions,
+            "temperature": prompt.temperature,
+            "max_tokens": prompt.max_tokens,
+            "image_policy": dataclasses.asdict(prompt.image_policy),
+            "model": prompt.model,
+            "image": configuration.image,
+            "sample_id": sample.sample_id,
+            # A sample replaced under the same id is evaluated again
+            "sample": sample_hash,
+        }
+        payload_str = json.dumps(payload, sort_keys=True)
+        return hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
+
+    def _load(self) -> dict[str, dict]:
+        stored = {}
+
+        if not os.path.exists(self._path):
+            return stored
+
+        line = "\n"
+
+        with open(self._path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last record of an interrupted run
+                    continue
+                stored[record["key"]] = record
+
+        # New records must not be appended to an incomplete last line
+        if not line.endswith("\n"):
+            with open(self._path, "a") as f:
+                f.write("\n")
+
+        return stored
+
+    def _store(self, key: str, record: dict) -> None:
+        with self._lock:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self._stored[key] = record
+
+
+def get_prompt(configuration: Configuration) -> promptrepo.Prompt:
+    prompt = promptrepo.get_prompt(
+        configuration.prompt_name, configuration.prompts_path
+    )
+    if configuration.model:
+        prompt.model = configuration.model
+    if configuration.image_policy:
+        prompt.image_policy = configuration.image_policy
+    return prompt
+
+
+def image_size(configuration: Configuration, samples: list[Sample]) -> float:
+    # Mean size in bytes of the encoded images sent with a sample
+    if not configuration.image:
+        return 0.0
+
+    policy = get_prompt(configuration).image_policy
+    encoder = images.ImageEncoder()
+    sizes = [
+        sum(len(url) for url in encoder.encode(sample.images, policy))
+        for sample in samples
+        if sample.images
+    ]
+    return sum(sizes) / len(sizes) if sizes else 0.0
+
+
+def _sample_hash(sample: Sample) -> str:
+    sample_hash = hashlib.sha256(
+        json.dumps(sample.data, sort_keys=True).encode("utf-8")
+    )
+    for image in sample.images or []:
+        sample_hash.update(hashlib.sha256(image).digest())
+    return sample_hash.hexdigest()
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    # Waits as long as the API asks for, otherwise backs off exponentially with
+    # jitter, so workers hitting the rate limit together don't retry together
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            pass
+    return min(60.0, 2**attempt) * random.uniform(0.5, 1.0)
+
+
+def read_file(path: str, binary: bool = False) -> str | bytes:
+    with open(path, "rb" if binary else "r") as fd:
+        return fd.read()
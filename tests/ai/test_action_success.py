@@ -1,20 +1,48 @@
 import os
 
 import mlflow
-import openai
+from openai.types import chat
 
-from ai_web_explorer import promptrepo
-from ai_web_explorer import config
+from ai_web_explorer import images
 import base
+import evaluation
 
 ACTIONS_PATH = os.path.join(base.DATA_PATH, "actions")
 
-
-def test_action_success():
-    mlflow.set_tracking_uri("http://localhost:5000")
-    mlflow.set_experiment("Action success")
+CONFIGURATIONS = [
+    evaluation.Configuration(
+        "verify_action_html gpt-4o-mini", "verify_action_html", "gpt-4o-mini"
+    ),
+    evaluation.Configuration(
+        "verify_action_images gpt-4o-mini", "verify_action_images", "gpt-4o-mini"
+    ),
+    evaluation.Configuration(
+        "verify_action_html gpt-4o", "verify_action_html", "gpt-4o"
+    ),
+    evaluation.Configuration(
+        "verify_action_images gpt-4o", "verify_action_images", "gpt-4o"
+    ),
+]
+
+# Screenshots cropped to the changed region and compressed, candidate image settings
+# of the verify_action prompt in prompts.yaml
+CROPPED_IMAGE_POLICY = images.ImagePolicy(format="jpeg", crop_changes=True)
+
+CONFIGURATIONS += [
+    evaluation.Configuration(
+        f"verify_action_images cropped images {model}",
+        "verify_action_images",
+        model,
+        image_policy=CROPPED_IMAGE_POLICY,
+    )
+    for model in ("gpt-4o-mini", "gpt-4o")
+]
+
+
+def load_actions() -> list[evaluation.Sample]:
     actions_list_path = os.path.join(ACTIONS_PATH, "actions.txt")
-
+    screenshots_path = os.path.join(ACTIONS_PATH, "screenshots")
+    htmls_path = os.path.join(ACTIONS_PATH, "htmls")
     actions = []
 
     with open(actions_list_path) as actions_list_fd:
@@ -23,115 +51,75 @@ def test_action_success():
             meta_split = meta.split(" ")
             success = int(meta_split[0])
             uuid = meta_split[1]
-            actions.append({"success": success, "uuid": uuid, "text": text})
-
-    with mlflow.start_run():
-        mlflow.log_param("model", "gpt-4o-mini")
-        mlflow.log_param("input_type", "verify_action_html")
-        eval_prompt(
-            actions,
-            "verify_action_html",
-            image=True,
-            same_fail=True,
-            model="gpt-4o-mini",
-        )
 
-    with mlflow.start_run():
-        mlflow.log_param("model", "gpt-4o-mini")
-        mlflow.log_param("input_type", "verify_action_images")
-        eval_prompt(
-            actions,
-            "verify_action_images",
-            image=True,
-            same_fail=True,
-            model="gpt-4o-mini",
-        )
+            screenshots = [
+                evaluation.read_file(
+                    os.path.join(screenshots_path, f"{uuid}_{when}.png"), binary=True
+                )
+                for when in ("before", "after")
+            ]
+            html_before, html_after = [
+                evaluation.read_file(os.path.join(htmls_path, f"{uuid}_{when}.html"))
+                for when in ("before", "after")
+            ]
+
+            actions.append(
+                evaluation.Sample(
+                    sample_id=uuid,
+                    expected=success,
+                    data={
+                        "action": text,
+                        "html_before": html_before,
+                        "html_after": html_after,
+                    },
+                    images=screenshots,
+                )
+            )
+
+    return actions
+
+
+def action_status(message: chat.ChatCompletionMessage) -> int:
+    if message.content is None:
+        return 0
+    return int("success" in message.content.lower())
 
-    with mlflow.start_run():
-        mlflow.log_param("model", "gpt-4o")
-        mlflow.log_param("input_type", "verify_action_html")
-        eval_prompt(
-            actions,
-            "verify_action_html",
-            image=True,
-            same_fail=True,
-            model="gpt-4o",
-        )
 
-    with mlflow.start_run():
-        mlflow.log_param("model", "gpt-4o")
-        mlflow.log_param("input_type", "verify_action_images")
-        eval_prompt(
-            actions,
-            "verify_action_images",
-            image=True,
-            same_fail=True,
-            model="gpt-4o",
-        )
+def test_action_success():
+    mlflow.set_tracking_uri("http://localhost:5000")
+    mlflow.set_experiment("Action success")
+    actions = load_actions()
 
+    # Actions that did not change the page are failures without asking the LLM
+    unchanged = {
+        a.sample_id for a in actions if a.images[0] == a.images[1] and a.expected == 0
+    }
+    evaluated = [a for a in actions if a.sample_id not in unchanged]
 
-def eval_prompt(
-    actions: list[dict], prompt_name, image: bool, same_fail: bool, model="gpt-4o"
-):
-    print("-----")
-    print(f"Evaluating prompt {prompt_name}, model: {model}")
+    evaluator = evaluation.Evaluator("action_success")
+    reports = evaluator.evaluate(CONFIGURATIONS, evaluated)
 
-    openai_client = openai.OpenAI()
-    screenshots_path = os.path.join(ACTIONS_PATH, "screenshots")
-    htmls_path = os.path.join(ACTIONS_PATH, "htmls")
-    prompt = promptrepo.get_prompt(prompt_name, config.PROMPTS_PATH_TEST)
-    prompt.model = model
-
-    correct_answers = 0
-    price_total = 0
-
-    for action in actions:
-        print(f"Action: {action['text']}")
-        with open(
-            os.path.join(screenshots_path, f"{action['uuid']}_before.png"), "rb"
-        ) as screenshot_fd:
-            screenshot_before = screenshot_fd.read()
-
-        with open(
-            os.path.join(screenshots_path, f"{action['uuid']}_after.png"), "rb"
-        ) as screenshot_fd:
-            screenshot_after = screenshot_fd.read()
-
-        if same_fail:
-            if screenshot_before == screenshot_after:
-                if action["success"] == 0:
-                    correct_answers += 1
-                    continue
-
-        with open(os.path.join(htmls_path, f"{action['uuid']}_before.html")) as html_fd:
-            html_before = html_fd.read()
-
-        with open(os.path.join(htmls_path, f"{action['uuid']}_after.html")) as html_fd:
-            html_after = html_fd.read()
-
-        image_bytes = [screenshot_before, screenshot_after] if image else None
-
-        result = prompt.execute_prompt(
-            openai_client,
-            image_bytes=image_bytes,
-            action=action["text"],
-            html_before=html_before,
-            html_after=html_after,
+    for report in reports:
+        correct_answers = len(unchanged) + sum(
+            action_status(r.message) == r.sample.expected for r in report.results
         )
+        accuracy = correct_answers / len(actions) * 100
+        image_size = evaluation.image_size(report.configuration, evaluated)
 
-        if result.message.content is None:
-            action_status = 0
-        else:
-            action_status = int("success" in result.message.content.lower())
-
-        if action_status == action["success"]:
-            correct_answers += 1
-
-        price_total += prompt.get_last_price()
-
-    accuracy = correct_answers / len(actions) * 100
-    mlflow.log_metric("accuracy", accuracy)
-    mlflow.log_metric("price_total", price_total)
-
-    print("Accuracy: ", accuracy)
-    print("Total price: ", price_total)
+        print("-----")
+        print(
+            f"Evaluating prompt {report.configuration.prompt_name}, "
+            f"model: {report.configuration.model}"
+        )
+        print("Accuracy: ", accuracy)
+        print(f"Image size: {image_size / 1024:.1f} kB")
+        print("Total price: ", report.price)
+        print(f"Stored results: {report.cached}, price of this run: {report.price_new}")
+
+        with mlflow.start_run():
+            mlflow.log_param("model", report.configuration.model)
+            mlflow.log_param("input_type", report.configuration.prompt_name)
+            mlflow.log_param("image_policy", report.configuration.image_policy)
+            mlflow.log_metric("accuracy", accuracy)
+            mlflow.log_metric("price_total", report.price)
+            mlflow.log_metric("image_size", image_size)
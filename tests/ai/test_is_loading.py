@@ -1,52 +1,72 @@
 import os
 
-import openai
+from openai.types import chat
 
-from ai_web_explorer import promptrepo
-from ai_web_explorer import config
+from ai_web_explorer import images
 import base
+import evaluation
 
 LOADING_YES_PATH = os.path.join(base.DATA_PATH, "loading", "yes")
 LOADING_NO_PATH = os.path.join(base.DATA_PATH, "loading", "no")
 
-openai_client = openai.OpenAI()
+CONFIGURATION = evaluation.Configuration("is_loading", "is_loading")
 
+# Downscaled and compressed screenshots, candidate image settings of the is_loading
+# prompt in prompts.yaml
+CONFIGURATION_SMALL_IMAGES = evaluation.Configuration(
+    "is_loading small images",
+    "is_loading",
+    image_policy=images.ImagePolicy(
+        max_size=512, format="jpeg", quality=80, detail="low"
+    ),
+)
 
-def test_is_loading():
-    prompt = promptrepo.get_prompt("is_loading", config.PROMPTS_PATH_TEST)
-    num_correct = 0
-    total = 0
-
-    for file in os.listdir(LOADING_YES_PATH):
-        with open(os.path.join(LOADING_YES_PATH, file), "rb") as fd:
-            screenshot_bytes = fd.read()
-        response = prompt.execute_prompt(openai_client, image_bytes=screenshot_bytes)
-
-        if response.message.content is None:
-            raise ValueError("No content in response when checking if page is loading")
 
-        is_loading = "yes" in response.message.content.lower()
+def load_screenshots() -> list[evaluation.Sample]:
+    samples = []
 
-        if is_loading:
-            num_correct += 1
+    for path, expected in [(LOADING_YES_PATH, True), (LOADING_NO_PATH, False)]:
+        for file in sorted(os.listdir(path)):
+            # Loading signals of the screenshots are stored next to them
+            if not file.endswith(".png"):
+                continue
+            screenshot_path = os.path.join(path, file)
+            samples.append(
+                evaluation.Sample(
+                    sample_id=os.path.relpath(screenshot_path, base.DATA_PATH),
+                    expected=expected,
+                    images=[evaluation.read_file(screenshot_path, binary=True)],
+                )
+            )
 
-        total += 1
+    return samples
 
-    for file in os.listdir(LOADING_NO_PATH):
-        with open(os.path.join(LOADING_NO_PATH, file), "rb") as fd:
-            screenshot_bytes = fd.read()
-        response = prompt.execute_prompt(openai_client, image_bytes=screenshot_bytes)
 
-        if response.message.content is None:
-            raise ValueError("No content in response when checking if page is loading")
+def is_loading(message: chat.ChatCompletionMessage) -> bool:
+    if message.content is None:
+        raise ValueError("No content in response when checking if page is loading")
+    return "yes" in message.content.lower()
 
-        is_loading = "yes" in response.message.content.lower()
 
-        if not is_loading:
-            num_correct += 1
-
-        total += 1
-
-    accuracy = num_correct / total
-    assert accuracy > 0.9
-    print(f"Accuracy {accuracy:.4f}")
+def test_is_loading():
+    samples = load_screenshots()
+    # Shares stored results with test_is_loading_signals
+    reports = evaluation.Evaluator("is_loading").evaluate(
+        [CONFIGURATION, CONFIGURATION_SMALL_IMAGES], samples
+    )
+
+    accuracies = []
+
+    for report in reports:
+        num_correct = sum(
+            is_loading(r.message) == r.sample.expected for r in report.results
+        )
+        accuracy = num_correct / len(samples)
+        image_size = evaluation.image_size(report.configuration, samples)
+
+        print(f"Configuration {report.configuration.name}")
+        print(f"Accuracy {accuracy:.4f}")
+        print(f"Image size {image_size / 1024:.1f} kB, price {report.price:.4f}")
+        accuracies.append(accuracy)
+
+    assert min(accuracies) > 0.9
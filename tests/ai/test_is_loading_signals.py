@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from ai_web_explorer import loading
+import base
+import evaluation
+import test_is_loading
+
+
+# Signals of a screenshot are stored next to it as <name>.json, the output of
+# window.getLoadingSignals() when the screenshot was taken (see capture_loading.py).
+def load_signals(screenshot_path: str) -> loading.LoadingSignals | None:
+    signals_path = os.path.splitext(screenshot_path)[0] + ".json"
+
+    if not os.path.exists(signals_path):
+        return None
+
+    with open(signals_path) as fd:
+        return loading.LoadingSignals(**json.load(fd))
+
+
+def test_is_loading_signals():
+    samples_all = test_is_loading.load_screenshots()
+    samples_signals = [
+        (sample, signals)
+        for sample in samples_all
+        if (signals := load_signals(os.path.join(base.DATA_PATH, sample.sample_id)))
+    ]
+
+    # Without signals, the evaluation would only repeat test_is_loading
+    if not samples_signals:
+        pytest.skip(
+            "No screenshots with loading signals, capture them with capture_loading.py"
+        )
+
+    num_correct_signals = 0
+    ambiguous = []
+
+    for sample, signals in samples_signals:
+        is_loading = loading.classify_loading(signals)
+
+        if is_loading is None:
+            ambiguous.append(sample)
+        elif is_loading == sample.expected:
+            num_correct_signals += 1
+
+    evaluator = evaluation.Evaluator("is_loading")
+    report = evaluator.evaluate([test_is_loading.CONFIGURATION], ambiguous)[0]
+    num_correct = num_correct_signals + sum(
+        test_is_loading.is_loading(r.message) == r.sample.expected
+        for r in report.results
+    )
+
+    num_decided = len(samples_signals) - len(ambiguous)
+    accuracy = num_correct / len(samples_signals)
+    llm_avoided = num_decided / len(samples_signals)
+    print(f"Screenshots with signals {len(samples_signals)} of {len(samples_all)}")
+    print(f"Accuracy {accuracy:.4f}")
+    if num_decided:
+        print(f"Accuracy of signals alone {num_correct_signals / num_decided:.4f}")
+    print(f"LLM calls avoided {llm_avoided:.4f}")
+    assert accuracy > 0.9
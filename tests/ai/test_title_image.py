@@ -6,21 +6,57 @@ import mlflow
 import numpy as np
 import openai
 import pandas as pd
+from openai.types import chat
 
-from ai_web_explorer import config
-from ai_web_explorer import promptrepo
+from ai_web_explorer import embeddings
 import base
+import evaluation
 
 TITLES_PATH = os.path.join(base.DATA_PATH, "title")
 
+CONFIGURATIONS = [
+    evaluation.Configuration("both", "page_title_both", image=True),
+    evaluation.Configuration("image_only", "page_title_image_only", image=True),
+    evaluation.Configuration("html_only", "page_title_html_only", image=False),
+]
+
 openai_client = openai.OpenAI()
 
 
-def get_embeddings(texts: list[str]) -> list[list[float]]:
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small", input=texts
-    )
-    return [embedding.embedding for embedding in response.data]
+def load_titles() -> list[evaluation.Sample]:
+    title_list_path = os.path.join(TITLES_PATH, "titles.csv")
+
+    with open(title_list_path) as titles_fd:
+        titles = list(csv.DictReader(titles_fd))
+
+    return [
+        evaluation.Sample(
+            sample_id=title["page_uuid"],
+            expected=title["title"],
+            data={
+                "html": evaluation.read_file(
+                    os.path.join(TITLES_PATH, "htmls", f"{title['page_uuid']}.html")
+                )
+            },
+            images=[
+                evaluation.read_file(
+                    os.path.join(
+                        TITLES_PATH, "screenshots", f"{title['page_uuid']}_start.png"
+                    ),
+                    binary=True,
+                )
+            ],
+        )
+        for title in titles
+    ]
+
+
+def generated_title(message: chat.ChatCompletionMessage) -> str:
+    if not message.tool_calls or len(message.tool_calls) == 0:
+        raise ValueError("No tool calls in response when getting page title")
+
+    args = json.loads(message.tool_calls[0].function.arguments)
+    return args["title"]
 
 
 def cosine_similarity(embeddings: list[list[float]]) -> float:
@@ -29,48 +65,31 @@ def cosine_similarity(embeddings: list[list[float]]) -> float:
     )
 
 
-def eval_prompt(titles: list[dict], prompt_name, image: bool):
+def log_report(report: evaluation.Report):
     print("-----")
-    print(f"Evaluating prompt {prompt_name}")
-    prompt = promptrepo.get_prompt(prompt_name, config.PROMPTS_PATH_TEST)
-    similarities = []
-    prices = []
-    titles_generated = []
-
-    for title in titles:
-        screenshot_path = os.path.join(
-            TITLES_PATH, "screenshots", f"{title['page_uuid']}_start.png"
-        )
-        html_path = os.path.join(TITLES_PATH, "htmls", f"{title['page_uuid']}.html")
-
-        if image:
-            with open(screenshot_path, "rb") as screenshot_fd:
-                screenshot_bytes = screenshot_fd.read()
-        else:
-            screenshot_bytes = None
-
-        with open(html_path) as html_fd:
-            html = html_fd.read()
+    print(f"Evaluating prompt {report.configuration.prompt_name}")
 
-        response = prompt.execute_prompt(
-            openai_client, image_bytes=screenshot_bytes, html=html
+    titles_generated = [generated_title(r.message) for r in report.results]
+    titles_expected = [r.sample.expected for r in report.results]
+    # One request for the embeddings of all titles, they are cached on disk
+    title_embeddings = embeddings.embed_titles(
+        openai_client, titles_generated + titles_expected
+    )
+    similarities = [
+        cosine_similarity([generated, expected])
+        for generated, expected in zip(
+            title_embeddings[: len(titles_generated)],
+            title_embeddings[len(titles_generated) :],
         )
-
-        if not response.message.tool_calls or len(response.message.tool_calls) == 0:
-            raise ValueError("No tool calls in response when getting page title")
-
-        args_str = response.message.tool_calls[0].function.arguments
-        args = json.loads(args_str)
-        title_generated = args["title"]
-        embeddings = get_embeddings([title_generated, title["title"]])
-
-        similarity = cosine_similarity(embeddings)
-        similarities.append(similarity)
-        price = prompt.get_last_price()
-        prices.append(price)
-        titles_generated.append(title_generated)
-
-    df = pd.DataFrame(titles)
+    ]
+    prices = [r.price for r in report.results]
+
+    df = pd.DataFrame(
+        {
+            "page_uuid": [r.sample.sample_id for r in report.results],
+            "title": titles_expected,
+        }
+    )
     df["title_generated"] = titles_generated
     df["similarity"] = similarities
     df["price"] = prices
@@ -84,6 +103,7 @@ def eval_prompt(titles: list[dict], prompt_name, image: bool):
     print("Similarity min: %.4f" % similarity_min)
     print("Price total: %.4f" % price_total)
     print("Similarity per price: %.4f" % similarity_per_price)
+    print(f"Stored results: {report.cached}, price of this run: {report.price_new:.4f}")
 
     mlflow.log_metric("similarity_mean", float(similatity_mean))
     mlflow.log_metric("similarity_min", similarity_min)
@@ -96,20 +116,10 @@ def test_title_image_impact():
     mlflow.set_tracking_uri("http://localhost:5000")
     mlflow.set_experiment("Title Input Types")
 
-    title_list_path = os.path.join(TITLES_PATH, "titles.csv")
-
-    with open(title_list_path) as titles_fd:
-        titles_reader = csv.DictReader(titles_fd)
-        titles = list(titles_reader)
-
-    with mlflow.start_run():
-        mlflow.log_param("input_type", "both")
-        eval_prompt(titles, "page_title_both", image=True)
-
-    with mlflow.start_run():
-        mlflow.log_param("input_type", "image_only")
-        eval_prompt(titles, "page_title_image_only", image=True)
+    evaluator = evaluation.Evaluator("title_image")
+    reports = evaluator.evaluate(CONFIGURATIONS, load_titles())
 
-    with mlflow.start_run():
-        mlflow.log_param("input_type", "html_only")
-        eval_prompt(titles, "page_title_html_only", image=False)
+    for report in reports:
+        with mlflow.start_run():
+            mlflow.log_param("input_type", report.configuration.name)
+            log_report(report)
@@ -0,0 +1,18 @@
+from ai_web_explorer import html
+
+
+def test_empty_html_is_one_empty_part():
+    chunks = html.HtmlChunks("")
+
+    assert len(chunks) == 1
+    assert chunks[0] == ""
+    assert list(chunks) == [""]
+
+
+def test_parts_cover_the_html():
+    page_html = "<div>" + "<p>Some text of a paragraph</p>" * 200 + "</div>"
+    chunks = html.HtmlChunks(page_html, max_tokens=100)
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == page_html
+    assert all(part.startswith("<") for part in chunks)
@@ -0,0 +1,69 @@
+import types
+
+from openai.types import chat
+
+from ai_web_explorer import llmcache
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.base_url = "http://llm.test/v1"
+        self.requests = []
+        self.chat = types.SimpleNamespace(
+            completions=types.SimpleNamespace(create=self._create)
+        )
+
+    def _create(self, **request):
+        self.requests.append(request)
+        # Only the fields sent by the API are set, like in responses of the client
+        return chat.ChatCompletion.model_validate(
+            {
+                "id": f"completion-{len(self.requests)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": request["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": f"answer {len(self.requests)}",
+                            "refusal": None,
+                        },
+                    }
+                ],
+            }
+        )
+
+
+def converse(client: FakeClient) -> list[str]:
+    messages = [{"role": "user", "content": "first question"}]
+    answers = []
+
+    for question in ("second question", None):
+        response = llmcache.create_completion(
+            client, prompt_name="test", model="gpt-4o-mini", messages=messages
+        ).choices[0]
+        answers.append(response.message.content)
+        messages.append(response.message)
+        if question:
+            messages.append({"role": "user", "content": question})
+
+    return answers
+
+
+def test_conversation_replayed_from_cache(tmp_path, monkeypatch):
+    cache = llmcache.ResponseCache(str(tmp_path), "readwrite")
+    monkeypatch.setattr(llmcache, "get_cache", lambda: cache)
+
+    client_live = FakeClient()
+    answers_live = converse(client_live)
+
+    client_replay = FakeClient()
+    answers_replay = converse(client_replay)
+
+    assert len(client_live.requests) == 2
+    assert client_replay.requests == []
+    assert answers_replay == answers_live